@@ -1,5 +1,6 @@
 import os
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 from jose import jwt, JWTError
 
 from fastapi import Request, HTTPException, status
@@ -30,6 +31,21 @@ async def get_current_user(request: Request):
     return payload["sub"]  # return user id
 
 
+async def get_stream_user(request: Request, token: Optional[str] = None):
+    """
+    get_current_user for event streams: browsers cannot set headers on
+    EventSource or WebSocket, so the token may come as a query parameter.
+    """
+    if token is None:
+        return await get_current_user(request)
+    payload = verify_token(token)
+    if payload is None or "sub" not in payload:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
+        )
+    return payload["sub"]
+
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -1,21 +1,40 @@
 import os
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 bucket_name = os.environ["S3_BUCKET"]
 
+# Threads doing S3 I/O, see storage.py; the client pool must be able to serve all of them
+S3_MAX_WORKERS = int(os.environ.get("S3_MAX_WORKERS", 16))
+
 s3 = boto3.client(
     "s3",
     endpoint_url=os.environ["S3_ENDPOINT"],
     aws_access_key_id=os.environ["S3_ACCESS_KEY"],
     aws_secret_access_key=os.environ["S3_SECRET_KEY"],
+    config=Config(max_pool_connections=S3_MAX_WORKERS * 2),
+)
+
+# Only signs URLs handed out to browsers, so it must use the endpoint they reach MinIO at
+public_s3 = boto3.client(
+    "s3",
+    endpoint_url=os.environ.get("S3_PUBLIC_ENDPOINT", os.environ["S3_ENDPOINT"]),
+    aws_access_key_id=os.environ["S3_ACCESS_KEY"],
+    aws_secret_access_key=os.environ["S3_SECRET_KEY"],
+    config=Config(signature_version="s3v4"),
 )
 
-try:
-    s3.create_bucket(Bucket=bucket_name)
-    print(f"✅ Bucket '{bucket_name}' created or already exists.")
-except ClientError as e:
-    if e.response["Error"]["Code"] == "BucketAlreadyOwnedByYou":
-        print(f"Bucket '{bucket_name}' already exists.")
-    else:
-        print(f"Error creating bucket: {e}")
+def create_bucket(client, bucket: str):
+    """
+    Create the bucket unless it exists. Only called at startup, not on import,
+    so an unreachable S3 surfaces as an exception the caller can retry on.
+    """
+    try:
+        client.create_bucket(Bucket=bucket)
+        print(f"✅ Bucket '{bucket}' created or already exists.")
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "BucketAlreadyOwnedByYou":
+            print(f"Bucket '{bucket}' already exists.")
+        else:
+            print(f"Error creating bucket: {e}")
@@ -1,4 +1,8 @@
+import asyncio
 import logging
+import os
+import re
+from contextlib import asynccontextmanager
 
 from aiomisc.log import basic_config
 
@@ -10,11 +14,14 @@ from .routers.process_router import process_router
 from .routers.image_router import image_router
 from .routers.token_router import token_router
 from .routers.user_router import user_router
-
-try:
-    from . import bucket_init
-except Exception as e:
-    print(f"❌ Failed to initialize bucket: {e}")
+from .routers.metrics_router import metrics_router
+from .process.worker import ExtractionWorker
+from .process.http_clients import http_clients
+from .process.image_processor import token_manager
+from .process.preprocess import preprocessor
+from .models.connector import connector
+from .status_events import status_events
+from .storage import storage
 
 tags_metadata = [
     {
@@ -23,7 +30,54 @@ tags_metadata = [
     },
 ]
 
-app = FastAPI(openapi_tags=tags_metadata)
+# Run an extraction worker inside the API process (handy for local setups).
+# In docker-compose extraction runs in the separate `worker` service instead.
+EXTRACTION_WORKER_IN_PROCESS = os.environ.get(
+    "EXTRACTION_WORKER_IN_PROCESS", "false"
+).lower() in ("1", "true", "yes")
+TOKEN_PARAM = re.compile(r"([?&]token=)[^&]*")
+
+
+class RedactAccessToken(logging.Filter):
+    """
+    The status streams take the access token as a query parameter, since
+    EventSource and WebSocket cannot send headers; keep it out of the access log.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # uvicorn.access args: client, method, path with query, HTTP version, status
+        if isinstance(record.args, tuple) and len(record.args) == 5:
+            args = list(record.args)
+            args[2] = TOKEN_PARAM.sub(r"\1[redacted]", str(args[2]))
+            record.args = tuple(args)
+        return True
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    worker = None
+    worker_task = None
+    status_listener = asyncio.create_task(status_events.listen(connector.dsn))
+    bucket_setup = asyncio.create_task(storage.ensure_bucket())
+    if EXTRACTION_WORKER_IN_PROCESS:
+        worker = ExtractionWorker()
+        worker_task = asyncio.create_task(worker.run())
+
+    yield
+
+    status_listener.cancel()
+    bucket_setup.cancel()
+    await asyncio.gather(status_listener, bucket_setup, return_exceptions=True)
+    if worker is not None:
+        worker.stop()
+        await worker_task
+    await token_manager.close()
+    await http_clients.close()
+    preprocessor.shutdown()
+    await connector.close()
+
+
+app = FastAPI(openapi_tags=tags_metadata, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -38,5 +92,7 @@ app.include_router(process_router)
 app.include_router(image_router)
 app.include_router(token_router)
 app.include_router(user_router)
+app.include_router(metrics_router)
 
 basic_config(logging.DEBUG, buffered=True)
+logging.getLogger("uvicorn.access").addFilter(RedactAccessToken())
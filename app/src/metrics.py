@@ -0,0 +1,64 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+LATENCY_WINDOW = 1024
+
+# name -> callable returning a JSON-serializable dict of current values
+_collectors: Dict[str, Callable[[], dict]] = {}
+
+
+def register_collector(name: str, collector: Callable[[], dict]):
+    _collectors[name] = collector
+
+
+def snapshot() -> dict:
+    """Current values of every registered collector in this process."""
+    return {name: collector() for name, collector in _collectors.items()}
+
+
+class LatencyStats:
+    """Counters and latency percentiles over the last LATENCY_WINDOW observations."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._window = deque(maxlen=LATENCY_WINDOW)
+
+    def observe(self, seconds: float, error: bool = False):
+        self.count += 1
+        self.errors += int(error)
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self._window.append(seconds)
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(time.perf_counter() - started, error)
+
+    def percentile(self, q: float) -> float:
+        if not self._window:
+            return 0.0
+        ordered = sorted(self._window)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": round(1000 * self.total_seconds / self.count, 2) if self.count else 0.0,
+            "p50_ms": round(1000 * self.percentile(0.5), 2),
+            "p95_ms": round(1000 * self.percentile(0.95), 2),
+            "max_ms": round(1000 * self.max_seconds, 2),
+        }
@@ -1,9 +1,19 @@
 import os
 
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from .. import metrics
 
 DB_CONTAINER_NAME = "database"
 
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# asyncpg prepared statements kept per connection
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 256))
+
 
 class DBConnector:
     def __init__(self):
@@ -13,9 +23,35 @@ class DBConnector:
         port = os.environ.get("PGPORT")
         db = os.environ.get("PGDATABASE")
 
-        database_url = f"postgresql://{user}:{password}@{host}:{port}/{db}"
+        # Plain DSN for dedicated asyncpg connections (LISTEN) outside the pool
+        self.dsn = f"postgresql://{user}:{password}@{host}:{port}/{db}"
+
+        database_url = (
+            f"postgresql+asyncpg://{user}:{password}@{host}:{port}/{db}"
+            f"?prepared_statement_cache_size={DB_STATEMENT_CACHE_SIZE}"
+        )
+
+        self.engine = create_async_engine(
+            database_url,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+            pool_pre_ping=DB_POOL_PRE_PING,
+        )
+
+    def stats(self) -> dict:
+        pool = self.engine.pool
+        return {
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+        }
 
-        self.engine = create_engine(database_url)
+    async def close(self):
+        await self.engine.dispose()
 
 
 connector = DBConnector()
+metrics.register_collector("db_pool", connector.stats)
@@ -0,0 +1,67 @@
+import json
+import os
+from typing import Optional, Tuple
+
+from .connector import connector
+from .queries import queries
+
+# Reuse results of images that only hash alike perceptually (re-encoded or
+# rescaled copies). Off by default: similar-looking receipts can differ in digits.
+# Such matches are limited to the same user, since another user's look-alike
+# receipt would hand over their store, items and totals. Exact matches are
+# shared: the same bytes mean the uploader already has that receipt.
+DEDUP_PERCEPTUAL = os.environ.get("DEDUP_PERCEPTUAL", "false").lower() in ("1", "true", "yes")
+
+
+class ExtractionCache:
+    async def get(
+        self,
+        content_hash: str,
+        perceptual_hash: str,
+        user_id: str,
+        workload: str,
+        prompt_version: str,
+    ) -> Optional[Tuple[dict, str]]:
+        """
+        Find a stored extraction result for the same image, or with
+        DEDUP_PERCEPTUAL for a look-alike image of the same user.
+        Returns: (result_json, match) where match is "exact" or "perceptual", or None
+        """
+        async with connector.engine.begin() as conn:
+            result = (
+                await conn.execute(
+                    queries["extraction_cache_get"],
+                    {
+                        "content_hash": content_hash,
+                        "perceptual_hash": perceptual_hash,
+                        "user_id": user_id,
+                        "workload": workload,
+                        "prompt_version": prompt_version,
+                        "match_perceptual": DEDUP_PERCEPTUAL,
+                    },
+                )
+            ).fetchone()
+            return (result.result_json, result.match) if result else None
+
+    async def put(
+        self,
+        content_hash: str,
+        perceptual_hash: str,
+        user_id: str,
+        workload: str,
+        prompt_version: str,
+        result_json: dict,
+    ):
+        """Store an extraction result, keeping the first one for a given image."""
+        async with connector.engine.begin() as conn:
+            await conn.execute(
+                queries["extraction_cache_insert"],
+                {
+                    "content_hash": content_hash,
+                    "perceptual_hash": perceptual_hash,
+                    "user_id": user_id,
+                    "workload": workload,
+                    "prompt_version": prompt_version,
+                    "result_json": json.dumps(result_json),
+                },
+            )
@@ -1,126 +1,163 @@
-from typing import List, Tuple
+from typing import List, Optional, Tuple
+import base64
 import json
-from sqlalchemy import text
+import os
 from datetime import datetime
 
-from ..constants import BASE_POSTGRES_TRANSACTIONS_DIRECTORY
 from .connector import connector
+from .queries import queries
 from ..process.schemas import ImageStatus
 
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+
+
+def encode_cursor(created_at: datetime, image_id: str) -> str:
+    """Opaque keyset cursor pointing right after the (created_at, id) row."""
+    raw = json.dumps([created_at.isoformat(), image_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], Optional[str]]:
+    """Returns (created_at, id) of the cursor row, or (None, None) for the first page."""
+    if not cursor:
+        return None, None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, image_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(image_id)
+    except (ValueError, TypeError):
+        pass
+    # Cursors issued before keyset pagination were a bare ISO timestamp
+    try:
+        return datetime.fromisoformat(cursor), ""
+    except ValueError:
+        return None, None
+
 
 class Image:
-    def create(self, user_id: str, s3_key: str, workload: str) -> dict:
-        """Create a new image record in the database."""
-        with connector.engine.begin() as conn:
-            insert_sql = open(
-                f"{BASE_POSTGRES_TRANSACTIONS_DIRECTORY}/image_insert.sql"
-            ).read()
-            query = text(insert_sql)
-            result = conn.execute(
-                query,
-                {
-                    "user_id": user_id,
-                    "s3_key": s3_key,
-                    "workload": workload,
-                },
+    async def create(
+        self,
+        user_id: str,
+        s3_key: str,
+        workload: str,
+        content_hash: str = None,
+        perceptual_hash: str = None,
+    ) -> dict:
+        """Create a new image record in the database and enqueue its extraction job."""
+        async with connector.engine.begin() as conn:
+            result = (
+                await conn.execute(
+                    queries["image_insert"],
+                    {
+                        "user_id": user_id,
+                        "s3_key": s3_key,
+                        "workload": workload,
+                        "content_hash": content_hash,
+                        "perceptual_hash": perceptual_hash,
+                        "max_attempts": JOB_MAX_ATTEMPTS,
+                    },
+                )
             ).fetchone()
             return {"id": result.id, "status": result.status}
 
-    def update_status(self, image_id: str, status: str, result_json: dict = None):
-        """Update the status and result of an image."""
-        with connector.engine.begin() as conn:
-            update_sql = open(
-                f"{BASE_POSTGRES_TRANSACTIONS_DIRECTORY}/image_update_status_and_result.sql"
-            ).read()
-            query = text(update_sql)
-            conn.execute(
-                query,
+    async def update_status(
+        self, image_id: str, status: str, result_json: dict = None, served_by: str = None
+    ):
+        """
+        Update the status and result of an image.
+        served_by records the provider of the result and is kept when not given.
+        """
+        async with connector.engine.begin() as conn:
+            await conn.execute(
+                queries["image_update_status_and_result"],
                 {
                     "image_id": image_id,
                     "status": status,
                     "status_reason": None,
                     "result_json": json.dumps(result_json) if result_json else "{}",
+                    "served_by": served_by,
                 },
             )
 
-    def update_error(self, image_id: str, error_reason: str, result_json: dict = None):
+    async def set_renditions_ready(self, image_id: str):
+        """Record that the thumbnail and preview of an image are stored."""
+        async with connector.engine.begin() as conn:
+            await conn.execute(queries["images_set_renditions_ready"], {"image_id": image_id})
+
+    async def update_error(
+        self, image_id: str, error_reason: str, result_json: dict = None
+    ):
         """Update the status and result of an image."""
-        with connector.engine.begin() as conn:
-            update_sql = open(
-                f"{BASE_POSTGRES_TRANSACTIONS_DIRECTORY}/image_update_status_and_result.sql"
-            ).read()
-            query = text(update_sql)
-            conn.execute(
-                query,
+        async with connector.engine.begin() as conn:
+            await conn.execute(
+                queries["image_update_status_and_result"],
                 {
                     "image_id": image_id,
                     "status": "error",
                     "status_reason": error_reason,
                     "result_json": json.dumps(result_json) if result_json else "{}",
+                    "served_by": None,
                 },
             )
 
-    def get_by_user(
-        self, user_id: str, cursor: str = None, limit: int = 10
-    ) -> Tuple[List[ImageStatus], str]:
+    async def get_by_user(
+        self,
+        user_id: str,
+        cursor: str = None,
+        limit: int = 10,
+        include_result: bool = True,
+    ) -> Tuple[List[dict], str]:
         """
-        Get paginated images for a specific user.
+        Get paginated images for a specific user, newest first.
+        Images are plain dicts carrying result_json as the raw JSON text from
+        Postgres, so they can be serialized without another parse/dump pass.
+        With include_result=False the result_json column is not read at all.
         Returns: (images, next_cursor)
         """
-        with connector.engine.begin() as conn:
-            # If cursor is provided, parse it as timestamp
-            cursor_timestamp = None
-            if cursor:
-                try:
-                    cursor_timestamp = datetime.fromisoformat(cursor)
-                except ValueError:
-                    cursor_timestamp = None
-
-            select_sql = open(
-                f"{BASE_POSTGRES_TRANSACTIONS_DIRECTORY}/images_get_by_user.sql"
-            ).read()
-            query = text(select_sql)
+        async with connector.engine.begin() as conn:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
 
             params = {
                 "user_id": user_id,
                 "limit": limit,
-                "cursor_timestamp": cursor_timestamp,
+                "cursor_created_at": cursor_created_at,
+                "cursor_id": cursor_id,
             }
 
-            results = conn.execute(query, params).fetchall()
+            query = queries[
+                "images_get_by_user" if include_result else "images_get_by_user_summary"
+            ]
+            results = (await conn.execute(query, params)).fetchall()
 
-            # Get the next cursor (timestamp of the last record)
+            # A short page is the last one
             next_cursor = None
-            if results:
-                next_cursor = results[-1].created_at.isoformat()
+            if len(results) == limit:
+                next_cursor = encode_cursor(results[-1].created_at, str(results[-1].id))
 
             images = [
-                ImageStatus(
-                    image_id=str(row.id),
-                    s3_key=str(row.s3_key),
-                    status=str(row.status),
-                    result_json=json.dumps(row.result_json),
-                    created_at=row.created_at,
-                )
+                {
+                    "image_id": str(row.id),
+                    "s3_key": row.s3_key,
+                    "status": row.status,
+                    "result_json": row.result_json if include_result else None,
+                    "created_at": row.created_at,
+                }
                 for row in results
             ]
 
             return images, next_cursor
 
-    def get_by_id(self, image_id: str) -> ImageStatus:
+    async def get_by_id(self, image_id: str) -> ImageStatus:
         """
         Get image by it's id.
         Returns: ImageStatus
         """
-        with connector.engine.begin() as conn:
-            select_sql = open(
-                f"{BASE_POSTGRES_TRANSACTIONS_DIRECTORY}/images_get_by_id.sql"
-            ).read()
-            query = text(select_sql)
-
+        async with connector.engine.begin() as conn:
             params = {"image_id": image_id}
 
-            result = conn.execute(query, params).fetchone()
+            result = (
+                await conn.execute(queries["images_get_by_id"], params)
+            ).fetchone()
 
             if not result:
                 return None
@@ -129,6 +166,34 @@ class Image:
                 image_id=str(result.id),
                 s3_key=str(result.s3_key),
                 status=str(result.status),
-                result_json=str(result.result_json),
+                result_json=result.result_json,
+                served_by=result.served_by,
                 created_at=result.created_at,
             )
+
+    async def get_by_ids(self, image_ids: List[str], user_id: str) -> List[dict]:
+        """
+        Get the images of `user_id` among `image_ids` in a single query.
+        Ids that do not exist or belong to another user are left out.
+        """
+        async with connector.engine.begin() as conn:
+            results = (
+                await conn.execute(
+                    queries["images_get_by_ids"],
+                    {"image_ids": list(image_ids), "user_id": user_id},
+                )
+            ).fetchall()
+
+            return [
+                {
+                    "image_id": str(row.id),
+                    "s3_key": row.s3_key,
+                    "status": row.status,
+                    "status_reason": row.status_reason,
+                    "served_by": row.served_by,
+                    "renditions_ready": row.renditions_ready,
+                    "result_json": row.result_json,
+                    "created_at": row.created_at,
+                }
+                for row in results
+            ]
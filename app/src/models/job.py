@@ -0,0 +1,100 @@
+from typing import List
+
+from .connector import connector
+from .queries import queries
+
+
+class Job:
+    async def claim(self, worker_id: str, limit: int, visibility_timeout: int) -> List:
+        """
+        Claim up to `limit` visible jobs for this worker.
+        Claimed jobs stay invisible to other workers for `visibility_timeout` seconds.
+        """
+        async with connector.engine.begin() as conn:
+            return (
+                await conn.execute(
+                    queries["jobs_claim"],
+                    {
+                        "worker_id": worker_id,
+                        "limit": limit,
+                        "visibility_timeout": float(visibility_timeout),
+                    },
+                )
+            ).fetchall()
+
+    async def touch(self, job_id: str, worker_id: str, visibility_timeout: int):
+        """Extend the visibility timeout of a job that is still being processed."""
+        async with connector.engine.begin() as conn:
+            await conn.execute(
+                queries["jobs_touch"],
+                {
+                    "job_id": job_id,
+                    "worker_id": worker_id,
+                    "visibility_timeout": float(visibility_timeout),
+                },
+            )
+
+    # A worker whose claim expired and was taken over no longer owns the job,
+    # so every transition below only applies to a job still running under
+    # `worker_id` and reports whether it did
+
+    async def complete(self, job_id: str, worker_id: str) -> bool:
+        """Mark a job as done."""
+        async with connector.engine.begin() as conn:
+            result = await conn.execute(
+                queries["jobs_complete"], {"job_id": job_id, "worker_id": worker_id}
+            )
+            return result.rowcount > 0
+
+    async def retry(self, job_id: str, worker_id: str, error: str, delay: int) -> bool:
+        """Put a job back in the queue, visible again after `delay` seconds."""
+        async with connector.engine.begin() as conn:
+            result = await conn.execute(
+                queries["jobs_retry"],
+                {
+                    "job_id": job_id,
+                    "worker_id": worker_id,
+                    "error": error,
+                    "delay": float(delay),
+                },
+            )
+            return result.rowcount > 0
+
+    async def defer(self, job_id: str, worker_id: str, reason: str, delay: float) -> bool:
+        """Put a job back in the queue after `delay` seconds without using up its attempt."""
+        async with connector.engine.begin() as conn:
+            result = await conn.execute(
+                queries["jobs_defer"],
+                {
+                    "job_id": job_id,
+                    "worker_id": worker_id,
+                    "error": reason,
+                    "delay": float(delay),
+                },
+            )
+            return result.rowcount > 0
+
+    async def release(self, job_id: str, worker_id: str) -> bool:
+        """Give a job back right away without using up its attempt, e.g. on shutdown."""
+        async with connector.engine.begin() as conn:
+            result = await conn.execute(
+                queries["jobs_release"], {"job_id": job_id, "worker_id": worker_id}
+            )
+            return result.rowcount > 0
+
+    async def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """Mark a job as permanently failed."""
+        async with connector.engine.begin() as conn:
+            result = await conn.execute(
+                queries["jobs_fail"],
+                {"job_id": job_id, "worker_id": worker_id, "error": error},
+            )
+            return result.rowcount > 0
+
+    async def fail_expired(self):
+        """
+        Fail jobs whose worker died during the last allowed attempt
+        and mark their images as errored.
+        """
+        async with connector.engine.begin() as conn:
+            await conn.execute(queries["jobs_fail_expired"])
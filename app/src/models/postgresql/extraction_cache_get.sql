@@ -0,0 +1,18 @@
+SELECT result_json, match
+FROM (
+    SELECT result_json, 'exact' AS match
+    FROM app.extraction_cache
+    WHERE content_hash = :content_hash
+      AND workload = :workload
+      AND prompt_version = :prompt_version
+    UNION ALL
+    SELECT result_json, 'perceptual' AS match
+    FROM app.extraction_cache
+    WHERE CAST(:match_perceptual AS BOOLEAN)
+      AND user_id = :user_id
+      AND perceptual_hash = :perceptual_hash
+      AND workload = :workload
+      AND prompt_version = :prompt_version
+) AS candidates
+ORDER BY match
+LIMIT 1;
@@ -0,0 +1,3 @@
+INSERT INTO app.extraction_cache (content_hash, perceptual_hash, user_id, workload, prompt_version, result_json)
+VALUES (:content_hash, :perceptual_hash, :user_id, :workload, :prompt_version, :result_json)
+ON CONFLICT (content_hash, workload, prompt_version) DO NOTHING;
@@ -1,3 +1,11 @@
-INSERT INTO app.images (user_id, s3_key, status, workload)
-VALUES (:user_id, :s3_key, 'created', :workload)
-RETURNING id, user_id, s3_key, status, workload, result_json, created_at;
+WITH image AS (
+    INSERT INTO app.images (user_id, s3_key, status, workload, content_hash, perceptual_hash)
+    VALUES (:user_id, :s3_key, 'created', :workload, :content_hash, :perceptual_hash)
+    RETURNING id, user_id, s3_key, status, workload, result_json, created_at
+), job AS (
+    INSERT INTO app.jobs (image_id, user_id, s3_key, workload, max_attempts)
+    SELECT id, user_id, s3_key, workload, :max_attempts
+    FROM image
+)
+SELECT id, user_id, s3_key, status, workload, result_json, created_at
+FROM image;
@@ -1,3 +1,7 @@
 UPDATE app.images
-SET status = :status, result_json = :result_json, status_reason=:status_reason
+SET status = :status,
+    result_json = :result_json,
+    status_reason = :status_reason,
+    served_by = COALESCE(CAST(:served_by AS TEXT), served_by),
+    updated_at = NOW()
 WHERE id = :image_id;
@@ -1,4 +1,4 @@
-SELECT *
+SELECT id, user_id, s3_key, status, status_reason, workload, served_by, result_json::text AS result_json, created_at
 FROM app.images
 WHERE id = :image_id
 LIMIT 1;
@@ -0,0 +1,4 @@
+SELECT id, s3_key, status, status_reason, served_by, renditions_ready, result_json::text AS result_json, created_at
+FROM app.images
+WHERE id = ANY(CAST(:image_ids AS TEXT[]))
+  AND user_id = :user_id;
@@ -1,5 +1,9 @@
-SELECT id, s3_key, status, result_json, created_at
+SELECT id, s3_key, status, result_json::text AS result_json, created_at
 FROM app.images
-WHERE user_id = :user_id AND (:cursor_timestamp IS NULL OR created_at < :cursor_timestamp)
-ORDER BY created_at DESC
+WHERE user_id = :user_id
+  AND (
+    CAST(:cursor_created_at AS TIMESTAMP) IS NULL
+    OR (created_at, id) < (:cursor_created_at, :cursor_id)
+  )
+ORDER BY created_at DESC, id DESC
 LIMIT :limit;
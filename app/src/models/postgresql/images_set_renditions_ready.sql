@@ -0,0 +1,3 @@
+UPDATE app.images
+SET renditions_ready = TRUE
+WHERE id = :image_id;
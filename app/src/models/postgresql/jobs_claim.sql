@@ -0,0 +1,21 @@
+UPDATE app.jobs
+SET status = 'running',
+    attempts = attempts + 1,
+    locked_by = :worker_id,
+    visible_at = NOW() + make_interval(secs => :visibility_timeout),
+    updated_at = NOW()
+FROM app.images
+WHERE app.images.id = app.jobs.image_id
+  AND app.jobs.id IN (
+    SELECT id
+    FROM app.jobs
+    WHERE status IN ('queued', 'running')
+      AND visible_at <= NOW()
+      AND attempts < max_attempts
+    ORDER BY visible_at
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING app.jobs.id, app.jobs.image_id, app.jobs.user_id, app.jobs.s3_key,
+    app.jobs.workload, app.jobs.attempts, app.jobs.max_attempts, app.jobs.deferrals,
+    app.images.content_hash, app.images.perceptual_hash;
@@ -0,0 +1,3 @@
+UPDATE app.jobs
+SET status = 'done', locked_by = NULL, last_error = NULL, updated_at = NOW()
+WHERE id = :job_id AND status = 'running' AND locked_by = :worker_id;
@@ -0,0 +1,9 @@
+UPDATE app.jobs
+SET status = 'queued',
+    attempts = GREATEST(attempts - 1, 0),
+    deferrals = deferrals + 1,
+    locked_by = NULL,
+    last_error = :error,
+    visible_at = NOW() + make_interval(secs => :delay),
+    updated_at = NOW()
+WHERE id = :job_id AND status = 'running' AND locked_by = :worker_id;
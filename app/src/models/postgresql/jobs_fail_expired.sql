@@ -0,0 +1,13 @@
+WITH expired AS (
+    UPDATE app.jobs
+    SET status = 'failed',
+        locked_by = NULL,
+        last_error = 'Visibility timeout exceeded on the last attempt',
+        updated_at = NOW()
+    WHERE status = 'running' AND visible_at <= NOW() AND attempts >= max_attempts
+    RETURNING image_id, last_error
+)
+UPDATE app.images
+SET status = 'error', status_reason = expired.last_error, updated_at = NOW()
+FROM expired
+WHERE app.images.id = expired.image_id;
@@ -0,0 +1,7 @@
+UPDATE app.jobs
+SET status = 'queued',
+    attempts = GREATEST(attempts - 1, 0),
+    locked_by = NULL,
+    visible_at = NOW(),
+    updated_at = NOW()
+WHERE id = :job_id AND status = 'running' AND locked_by = :worker_id;
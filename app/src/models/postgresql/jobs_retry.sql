@@ -0,0 +1,7 @@
+UPDATE app.jobs
+SET status = 'queued',
+    locked_by = NULL,
+    last_error = :error,
+    visible_at = NOW() + make_interval(secs => :delay),
+    updated_at = NOW()
+WHERE id = :job_id AND status = 'running' AND locked_by = :worker_id;
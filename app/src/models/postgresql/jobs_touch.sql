@@ -0,0 +1,3 @@
+UPDATE app.jobs
+SET visible_at = NOW() + make_interval(secs => :visibility_timeout), updated_at = NOW()
+WHERE id = :job_id AND status = 'running' AND locked_by = :worker_id;
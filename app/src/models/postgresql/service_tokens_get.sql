@@ -0,0 +1,3 @@
+SELECT access_token, refresh_token, expires_at, refresh_expires_at
+FROM app.service_tokens
+WHERE name = :name;
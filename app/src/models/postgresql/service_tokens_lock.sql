@@ -0,0 +1 @@
+SELECT pg_advisory_xact_lock(hashtext(:name));
@@ -0,0 +1,8 @@
+INSERT INTO app.service_tokens (name, access_token, refresh_token, expires_at, refresh_expires_at)
+VALUES (:name, :access_token, :refresh_token, :expires_at, :refresh_expires_at)
+ON CONFLICT (name) DO UPDATE
+SET access_token = EXCLUDED.access_token,
+    refresh_token = EXCLUDED.refresh_token,
+    expires_at = EXCLUDED.expires_at,
+    refresh_expires_at = EXCLUDED.refresh_expires_at,
+    updated_at = NOW();
@@ -0,0 +1,3 @@
+DELETE FROM app.tokens
+WHERE token = :token AND user_id = :user_id
+RETURNING token;
@@ -0,0 +1,85 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Optional
+
+from .connector import connector
+from .queries import queries
+
+# A pooled connection and the lock are held while the token is fetched, so the
+# fetch is bounded instead of relying on the HTTP read timeout meant for models
+SERVICE_TOKEN_FETCH_TIMEOUT = float(os.environ.get("SERVICE_TOKEN_FETCH_TIMEOUT", 15))
+# Waiting longer than the holder may take means it is stuck, give up on the lock
+SERVICE_TOKEN_LOCK_TIMEOUT = float(
+    os.environ.get("SERVICE_TOKEN_LOCK_TIMEOUT", SERVICE_TOKEN_FETCH_TIMEOUT + 5)
+)
+
+
+def _to_timestamp(value: Optional[float]) -> Optional[datetime]:
+    # TIMESTAMP columns hold UTC, asyncpg wants a naive value
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+
+
+def _from_timestamp(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class ServiceTokens:
+    """Upstream access tokens shared by all API and worker processes."""
+
+    async def get_or_refresh(
+        self,
+        name: str,
+        valid_until: float,
+        fetch: Callable[[Optional[dict]], Awaitable[dict]],
+    ) -> dict:
+        """
+        Return the stored token if it is still valid at `valid_until`, otherwise
+        call `fetch(stored token or None)` and store its result.
+
+        An advisory lock is held meanwhile, so of all processes wanting a new
+        token only the first one fetches it and the others pick it up.
+        Raises asyncio.TimeoutError when the fetch takes longer than
+        SERVICE_TOKEN_FETCH_TIMEOUT, and a database error when the lock is not
+        granted within SERVICE_TOKEN_LOCK_TIMEOUT.
+
+        Tokens are dicts of access_token, refresh_token, expires_at and
+        refresh_expires_at, the latter two as epoch seconds.
+        """
+        async with connector.engine.begin() as conn:
+            # Scoped to this transaction, the pooled connection keeps its default
+            await conn.execute(
+                queries["service_tokens_lock_timeout"],
+                {"lock_timeout": f"{int(SERVICE_TOKEN_LOCK_TIMEOUT * 1000)}ms"},
+            )
+            await conn.execute(queries["service_tokens_lock"], {"name": name})
+            row = (
+                await conn.execute(queries["service_tokens_get"], {"name": name})
+            ).fetchone()
+            stored = None
+            if row is not None:
+                stored = {
+                    "access_token": row.access_token,
+                    "refresh_token": row.refresh_token,
+                    "expires_at": _from_timestamp(row.expires_at),
+                    "refresh_expires_at": _from_timestamp(row.refresh_expires_at),
+                }
+                if stored["expires_at"] > valid_until:
+                    return stored
+
+            token = await asyncio.wait_for(fetch(stored), SERVICE_TOKEN_FETCH_TIMEOUT)
+            await conn.execute(
+                queries["service_tokens_upsert"],
+                {
+                    "name": name,
+                    "access_token": token["access_token"],
+                    "refresh_token": token["refresh_token"],
+                    "expires_at": _to_timestamp(token["expires_at"]),
+                    "refresh_expires_at": _to_timestamp(token["refresh_expires_at"]),
+                },
+            )
+            return token
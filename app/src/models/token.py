@@ -2,29 +2,39 @@ import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-from sqlalchemy import text
-
-from ..constants import BASE_POSTGRES_TRANSACTIONS_DIRECTORY
+from .queries import queries
 
 
 def generate_token() -> str:
     return str(uuid.uuid4())
 
 
-def create_token(connector, user_id: str, days_valid: Optional[int] = None) -> dict:
-    with connector.engine.begin() as conn:
+async def create_token(connector, user_id: str, days_valid: Optional[int] = None) -> dict:
+    async with connector.engine.begin() as conn:
         token = generate_token()
         expires_at = None
         if days_valid is not None:
             expires_at = datetime.now(timezone.utc) + timedelta(days=days_valid)
 
-        with open(f"{BASE_POSTGRES_TRANSACTIONS_DIRECTORY}/tokens_create.sql") as f:
-            query = text(f.read())
-            conn.execute(
-                query, {"user_id": user_id, "token": token, "expires_at": expires_at}
-            ).fetchone()
+        # expires_at is a TIMESTAMP column holding UTC, asyncpg wants a naive value
+        await conn.execute(
+            queries["tokens_create"],
+            {
+                "user_id": user_id,
+                "token": token,
+                "expires_at": expires_at.replace(tzinfo=None) if expires_at else None,
+            },
+        )
 
         return {
             "token": token,
             "expires_at": expires_at.isoformat() if expires_at else None,
         }
+
+
+async def revoke_token(connector, user_id: str, token: str) -> bool:
+    async with connector.engine.begin() as conn:
+        result = await conn.execute(
+            queries["tokens_revoke"], {"user_id": user_id, "token": token}
+        )
+        return result.fetchone() is not None
@@ -1,9 +1,7 @@
 import hashlib
 import uuid
 
-from sqlalchemy import text
-
-from ..constants import BASE_POSTGRES_TRANSACTIONS_DIRECTORY
+from .queries import queries
 
 
 def hash_password(password: str) -> str:
@@ -14,32 +12,28 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return hash_password(plain_password) == hashed_password
 
 
-def create_user(connection, email: str, password: str):
+async def create_user(connection, email: str, password: str):
     user_id = str(uuid.uuid4())
     hashed_password = hash_password(password)
-    with open(f"{BASE_POSTGRES_TRANSACTIONS_DIRECTORY}/user_create.sql") as f:
-        query = text(f.read())
-        return connection.execute(
-            query,
-            {"user_id": user_id, "email": email, "hashed_password": hashed_password},
-        ).fetchone()
+    result = await connection.execute(
+        queries["user_create"],
+        {"user_id": user_id, "email": email, "hashed_password": hashed_password},
+    )
+    return result.fetchone()
 
 
-def get_user_by_email(connection, email: str):
-    with open(f"{BASE_POSTGRES_TRANSACTIONS_DIRECTORY}/user_get_by_email.sql") as f:
-        query = text(f.read())
-        return connection.execute(query, {"email": email}).fetchone()
+async def get_user_by_email(connection, email: str):
+    result = await connection.execute(queries["user_get_by_email"], {"email": email})
+    return result.fetchone()
 
 
-def update_cloud_key(connection, user_id: str, cloud_key: str):
-    with open(f"{BASE_POSTGRES_TRANSACTIONS_DIRECTORY}/user_update_cloud_key.sql") as f:
-        query = text(f.read())
-        return connection.execute(
-            query, {"user_id": user_id, "cloud_key": cloud_key}
-        ).fetchone()
+async def update_cloud_key(connection, user_id: str, cloud_key: str):
+    result = await connection.execute(
+        queries["user_update_cloud_key"], {"user_id": user_id, "cloud_key": cloud_key}
+    )
+    return result.fetchone()
 
 
-def get_cloud_key(connection, user_id: str):
-    with open(f"{BASE_POSTGRES_TRANSACTIONS_DIRECTORY}/user_get_cloud_key.sql") as f:
-        query = text(f.read())
-        return connection.execute(query, {"user_id": user_id}).fetchone()
+async def get_cloud_key(connection, user_id: str):
+    result = await connection.execute(queries["user_get_cloud_key"], {"user_id": user_id})
+    return result.fetchone()
@@ -0,0 +1,96 @@
+import os
+from typing import Dict
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from .. import metrics
+
+HTTP_LIMIT_PER_HOST = int(os.environ.get("HTTP_LIMIT_PER_HOST", 32))
+HTTP_KEEPALIVE_TIMEOUT = float(os.environ.get("HTTP_KEEPALIVE_TIMEOUT", 60))
+HTTP_DNS_CACHE_TTL = int(os.environ.get("HTTP_DNS_CACHE_TTL", 300))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 10))
+HTTP_READ_TIMEOUT = float(os.environ.get("HTTP_READ_TIMEOUT", 300))
+
+
+class ClientRegistry:
+    """
+    Process-wide aiohttp sessions, one per upstream host.
+
+    Each session owns a keep-alive connector with its own connection limit and
+    DNS cache, so repeated calls to openrouter.ai or the StratPro hosts reuse
+    open TLS connections instead of handshaking on every request.
+    Sessions are created lazily and closed from the app lifespan.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    def session(self, url: str) -> aiohttp.ClientSession:
+        """Return the shared session for the host of `url`."""
+        host = urlsplit(url).netloc
+        session = self._sessions.get(host)
+        if session is None or session.closed:
+            session = self._create_session(host)
+            self._sessions[host] = session
+        return session
+
+    def _create_session(self, host: str) -> aiohttp.ClientSession:
+        counters = self._counters.setdefault(
+            host, {"connections_created": 0, "connections_reused": 0}
+        )
+
+        async def on_connection_create_end(session, ctx, params):
+            counters["connections_created"] += 1
+
+        async def on_connection_reuseconn(session, ctx, params):
+            counters["connections_reused"] += 1
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+
+        connector = aiohttp.TCPConnector(
+            limit=0,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+            use_dns_cache=True,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        )
+        timeout = aiohttp.ClientTimeout(
+            total=None,
+            connect=HTTP_CONNECT_TIMEOUT,
+            sock_read=HTTP_READ_TIMEOUT,
+        )
+        return aiohttp.ClientSession(
+            connector=connector, timeout=timeout, trace_configs=[trace_config]
+        )
+
+    def stats(self) -> dict:
+        """Connection pool statistics per upstream host."""
+        stats = {}
+        for host, session in self._sessions.items():
+            connector = session.connector
+            in_use = len(connector._acquired) if connector else 0
+            idle = sum(len(c) for c in connector._conns.values()) if connector else 0
+            waiting = sum(len(w) for w in connector._waiters.values()) if connector else 0
+            stats[host] = {
+                "limit_per_host": HTTP_LIMIT_PER_HOST,
+                "in_use": in_use,
+                "idle": idle,
+                "waiting": waiting,
+                "closed": session.closed,
+                **self._counters.get(host, {}),
+            }
+        return stats
+
+    async def close(self):
+        for session in self._sessions.values():
+            if not session.closed:
+                await session.close()
+        self._sessions.clear()
+
+
+http_clients = ClientRegistry()
+metrics.register_collector("http_clients", http_clients.stats)
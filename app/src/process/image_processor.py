@@ -1,59 +1,225 @@
+import asyncio
 import openai
 import json
 import aiohttp
-import base64
 import os
 import time
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 from fastapi import HTTPException
 import uuid
 
+from .. import metrics
+from ..models.service_token import ServiceTokens
+from .http_clients import http_clients
+from .payload import ImageSource, json_with_image
+
+service_tokens = ServiceTokens()
+
+# Stands in for the image in a payload until it is streamed into the body
+IMAGE_PLACEHOLDER = "__image_base64__"
+
+# Bump when a workload's prompt or model changes, so cached results of the
+# old prompt are no longer reused for duplicate images
+PROMPT_VERSIONS = {
+    "cloud": "1",
+    "on_premise": "1",
+    "local": "1",
+}
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_MODEL = "qwen/qwen2.5-vl-72b-instruct:free"
+# OpenAI-compatible inference service inside the cluster (qwen/server.py or qwen/fake_server.py).
+# Unset unless one is deployed, which also turns the "local" workload off.
+LOCAL_INFERENCE_URL = os.environ.get("LOCAL_INFERENCE_URL")
+LOCAL_INFERENCE_MODEL = os.environ.get("LOCAL_INFERENCE_MODEL", "qwen2-vl")
+STRATPRO_FILES_URL = "https://platform.stratpro.hse.ru/pu-ocr-qwen-pa-qwen/files/users/"
+
+stratpro_uploads = {"uploaded": 0, "skipped": 0}
+metrics.register_collector("stratpro_uploads", lambda: dict(stratpro_uploads))
+
+
+# The background task renews the token this long before it expires
+TOKEN_REFRESH_MARGIN = float(os.environ.get("TOKEN_REFRESH_MARGIN", 60))
+# Pause before retrying a failed background refresh
+TOKEN_RETRY_DELAY = float(os.environ.get("TOKEN_RETRY_DELAY", 5))
+# The background task stops after the token has not been used for this long
+TOKEN_IDLE_TIMEOUT = float(os.environ.get("TOKEN_IDLE_TIMEOUT", 1800))
+# Share the token through Postgres so worker processes do not each fetch their own
+TOKEN_SHARED_CACHE = os.environ.get("TOKEN_SHARED_CACHE", "true").lower() in ("1", "true", "yes")
+# Lifetime assumed when the SSO response has no expires_in
+DEFAULT_TOKEN_LIFETIME = 600
+# A token this close to expiry is not handed out any more
+TOKEN_EXPIRY_SKEW = 5
+
 
 class TokenManager:
+    """
+    StratPro SSO token, fetched by one caller at a time and renewed ahead of
+    expiry by a background task. Renewal uses the refresh-token grant while
+    the refresh token is valid and falls back to the password grant.
+    """
+
     def __init__(self, client_id: str, username: str, password: str):
         self.client_id = client_id
         self.username = username
         self.password = password
         self.token_url = "https://platform-sso.stratpro.hse.ru/realms/platform.stratpro.hse.ru/protocol/openid-connect/token"
-        self._access_token: Optional[str] = None
-        self._token_expiry: float = 0
+        self.cache_name = f"stratpro:{client_id}:{username}"
+        self._token: Optional[dict] = None
+        self._refresh_at: float = 0
+        self._last_used: float = 0
+        self._lock = asyncio.Lock()
+        self._refresher: Optional[asyncio.Task] = None
+        self._counters = {
+            "password_grants": 0,
+            "refresh_grants": 0,
+            "shared_hits": 0,
+            "failures": 0,
+        }
+
+    def _valid(self) -> bool:
+        return (
+            self._token is not None
+            and time.time() < self._token["expires_at"] - TOKEN_EXPIRY_SKEW
+        )
 
     async def get_token(self) -> str:
-        current_time = time.time()
-
-        # Return existing token if it's still valid
-        if self._access_token and current_time < self._token_expiry:
-            return self._access_token
-
-        # Get new token
-        token_data = {
-            "grant_type": "password",
-            "client_id": self.client_id,
-            "username": self.username,
-            "password": self.password,
-        }
+        self._last_used = time.time()
+        if not self._valid():
+            async with self._lock:
+                # Whoever waited on the lock gets the token the first caller fetched
+                if not self._valid():
+                    await self._refresh()
+        self._ensure_refresher()
+        return self._token["access_token"]
+
+    async def _refresh(self):
+        """Replace the in-memory token; callers hold self._lock."""
+        if TOKEN_SHARED_CACHE:
+            fetched = []
+
+            async def fetch(stored: Optional[dict]) -> dict:
+                fetched.append(True)
+                return await self._fetch(stored)
+
+            try:
+                token = await service_tokens.get_or_refresh(
+                    self.cache_name, time.time() + TOKEN_REFRESH_MARGIN, fetch
+                )
+            except HTTPException:
+                raise
+            except asyncio.TimeoutError:
+                # The SSO itself is slow, fetching again without the lock would not help
+                self._counters["failures"] += 1
+                raise HTTPException(
+                    status_code=504, detail="Timed out obtaining authentication token"
+                )
+            except Exception as e:
+                # Also reached when another process holds the lock for too long
+                print(f"Shared token cache unavailable, fetching directly: {e}")
+                token = await self._fetch(self._token)
+            else:
+                if not fetched:
+                    # Another process renewed it already
+                    self._counters["shared_hits"] += 1
+        else:
+            token = await self._fetch(self._token)
+
+        self._token = token
+        lifetime = token["expires_at"] - time.time()
+        self._refresh_at = token["expires_at"] - min(TOKEN_REFRESH_MARGIN, lifetime / 2)
+
+    async def _fetch(self, current: Optional[dict]) -> dict:
+        """New token from the SSO, through the refresh grant when `current` allows it."""
+        now = time.time()
+        if (
+            current is not None
+            and current.get("refresh_token")
+            and (current["refresh_expires_at"] is None or now < current["refresh_expires_at"] - TOKEN_EXPIRY_SKEW)
+        ):
+            try:
+                token = await self._grant(
+                    {"grant_type": "refresh_token", "refresh_token": current["refresh_token"]}
+                )
+                self._counters["refresh_grants"] += 1
+                return token
+            except HTTPException as e:
+                # A revoked or expired session is answered with 400/401
+                if e.status_code not in (400, 401):
+                    raise
+                print(f"Refresh token rejected, falling back to password grant: {e.detail}")
+
+        token = await self._grant(
+            {"grant_type": "password", "username": self.username, "password": self.password}
+        )
+        self._counters["password_grants"] += 1
+        return token
 
+    async def _grant(self, data: Dict[str, str]) -> dict:
         token_headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
+        requested_at = time.time()
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    self.token_url, data=token_data, headers=token_headers
-                ) as response:
-                    response.raise_for_status()
-                    token_response = await response.json()
-
-                    self._access_token = token_response["access_token"]
-                    # Set token expiry to 10 minutes from now
-                    self._token_expiry = current_time + 600  # 600 seconds = 10 minutes
-
-                    return self._access_token
+            session = http_clients.session(self.token_url)
+            async with session.post(
+                self.token_url, data={"client_id": self.client_id, **data}, headers=token_headers
+            ) as response:
+                if response.status >= 400:
+                    raise await upstream_error(response, "Failed to obtain authentication token")
+                token_response = await response.json()
+        except HTTPException:
+            self._counters["failures"] += 1
+            raise
         except Exception as e:
+            self._counters["failures"] += 1
             raise HTTPException(
                 status_code=500,
                 detail=f"Failed to obtain authentication token: {str(e)}",
             )
 
+        # Lifetimes count from when the request was sent, to stay on the safe side
+        refresh_expires_in = token_response.get("refresh_expires_in")
+        return {
+            "access_token": token_response["access_token"],
+            "refresh_token": token_response.get("refresh_token"),
+            "expires_at": requested_at
+            + float(token_response.get("expires_in") or DEFAULT_TOKEN_LIFETIME),
+            # Keycloak reports 0 for offline sessions that do not expire
+            "refresh_expires_at": requested_at + float(refresh_expires_in)
+            if refresh_expires_in
+            else None,
+        }
+
+    def _ensure_refresher(self):
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self):
+        while time.time() - self._last_used < TOKEN_IDLE_TIMEOUT:
+            await asyncio.sleep(max(self._refresh_at - time.time(), 0))
+            try:
+                async with self._lock:
+                    if time.time() >= self._refresh_at:
+                        await self._refresh()
+            except Exception as e:
+                detail = e.detail if isinstance(e, HTTPException) else e
+                print(f"Background token refresh failed: {detail}")
+                await asyncio.sleep(TOKEN_RETRY_DELAY)
+
+    async def close(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            await asyncio.gather(self._refresher, return_exceptions=True)
+            self._refresher = None
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "expires_in": round(max(self._token["expires_at"] - time.time(), 0), 1)
+            if self._token
+            else None,
+            "refreshing": self._refresher is not None and not self._refresher.done(),
+        }
+
 
 # Initialize TokenManager with environment variables
 token_manager = TokenManager(
@@ -61,26 +227,49 @@ token_manager = TokenManager(
     username=os.getenv("STRATPRO_LOGIN"),
     password=os.getenv("STRATPRO_PASSWORD"),
 )
+metrics.register_collector("stratpro_token", token_manager.stats)
 
 
-def encode_image(image_path: str) -> str:
-    """Encode image file to base64 string."""
-    try:
-        with open(image_path, "rb") as img_file:
-            return base64.b64encode(img_file.read()).decode("utf-8")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to encode image: {str(e)}")
+async def upstream_error(response: aiohttp.ClientResponse, message: str) -> HTTPException:
+    """
+    HTTPException with the upstream status and Retry-After, so the provider
+    limiter can tell throttling apart from failures.
+    """
+    retry_after = response.headers.get("Retry-After")
+    return HTTPException(
+        status_code=response.status,
+        detail=f"{message}: {await response.text()}",
+        headers={"Retry-After": retry_after} if retry_after else None,
+    )
 
 
 async def extract_json_from_image_cloud(
-    image_path: str, cloud_key: str
+    image: ImageSource, cloud_key: str
+) -> Dict[str, Any]:
+    """Extract JSON data from an image using Qwen model via OpenRouter API."""
+    return await extract_json_from_image_chat(
+        image, OPENROUTER_URL, OPENROUTER_MODEL, cloud_key
+    )
+
+
+async def extract_json_from_image_local(image: ImageSource) -> Dict[str, Any]:
+    """Extract JSON data from an image using the in-cluster inference service."""
+    return await extract_json_from_image_chat(
+        image, LOCAL_INFERENCE_URL, LOCAL_INFERENCE_MODEL
+    )
+
+
+async def extract_json_from_image_chat(
+    image: ImageSource, url: str, model: str, api_key: Optional[str] = None
 ) -> Dict[str, Any]:
     """
-    Extract JSON data from an image using Qwen model via OpenRouter API.
+    Extract JSON data from an image through an OpenAI-compatible chat completions API.
 
     Args:
-        image_path: Path to the image file
-        cloud_key: User's OpenRouter API key
+        image: Image to extract from, streamed into the request as base64
+        url: Chat completions endpoint
+        model: Model name sent with the request
+        api_key: Bearer token, if the endpoint needs one
 
     Returns:
         Dictionary containing the extracted JSON data
@@ -89,10 +278,6 @@ async def extract_json_from_image_cloud(
         HTTPException: If the API call fails or returns invalid data
     """
     try:
-        # Encode image
-        encoded_image = encode_image(image_path)
-        print("Encoded image")
-
         # Create prompt for JSON extraction
         prompt_text = """
         #Your Task: Receipt Recognition and Data Extraction
@@ -177,7 +362,7 @@ async def extract_json_from_image_cloud(
 
         # Prepare the request payload
         payload = {
-            "model": "qwen/qwen2.5-vl-72b-instruct:free",
+            "model": model,
             "messages": [
                 {
                     "role": "user",
@@ -186,7 +371,7 @@ async def extract_json_from_image_cloud(
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{encoded_image}"
+                                "url": IMAGE_PLACEHOLDER
                             },
                         },
                     ],
@@ -194,110 +379,190 @@ async def extract_json_from_image_cloud(
             ],
         }
 
-        # Make API call to OpenRouter
+        # The image is base64-encoded chunk by chunk while the body is sent
+        body, content_length = json_with_image(
+            payload, IMAGE_PLACEHOLDER, image, f"data:{image.content_type};base64,"
+        )
+
         headers = {
-            "Authorization": f"Bearer {cloud_key}",
+            "Content-Type": "application/json",
+            "Content-Length": str(content_length),
         }
+        if api_key:
+            headers["Authorization"] = f"Bearer {api_key}"
+
+        session = http_clients.session(url)
+        async with session.post(url, data=body, headers=headers) as response:
+            if response.status != 200:
+                raise await upstream_error(response, "Failed to process image")
+
+            response_data = await response.json()
+            content = (
+                response_data["choices"][0]["message"]["content"]
+                .replace("```", "")
+                .replace("json", "")
+            )
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://openrouter.ai/api/v1/chat/completions",
-                json=payload,
-                headers=headers,
-            ) as response:
-                if response.status != 200:
-                    raise HTTPException(
-                        status_code=response.status,
-                        detail=f"Failed to process image: {await response.text()}",
-                    )
-
-                response_data = await response.json()
-                content = (
-                    response_data["choices"][0]["message"]["content"]
-                    .replace("```", "")
-                    .replace("json", "")
+            # Try to parse the response as JSON
+            try:
+                return json.loads(content)
+            except json.JSONDecodeError:
+                raise HTTPException(
+                    status_code=422, detail="Failed to parse model response as JSON"
                 )
 
-                # Try to parse the response as JSON
-                try:
-                    return json.loads(content)
-                except json.JSONDecodeError:
-                    raise HTTPException(
-                        status_code=500, detail="Failed to parse model response as JSON"
-                    )
-
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to process image: {str(e)}"
         )
 
 
-async def upload_image_to_s3(s3_key: str, image_path: str, access_token: str) -> str:
+async def request_stratpro_file(s3_key: str, access_token: str) -> Tuple[dict, bool]:
+    """
+    Ask StratPro for presigned URLs of the file named `s3_key`.
+
+    Returns:
+        (files info, whether the file exists there already)
+
+    Raises:
+        HTTPException: If StratPro refuses both the creation and the lookup
+    """
+    headers = {"Authorization": f"Bearer {access_token}"}
+    files_url = f"{STRATPRO_FILES_URL}{s3_key}"
+    session = http_clients.session(files_url)
+
+    # Creating a file that is already there is answered with 400
+    async with session.put(files_url, headers=headers) as response:
+        if response.status in [200, 201]:
+            return await response.json(), False
+        if response.status != 400:
+            raise await upstream_error(response, "Failed to get presigned URL")
+
+    async with session.get(files_url, headers=headers) as response:
+        if response.status != 200:
+            raise await upstream_error(response, "Failed to get presigned URL")
+        return await response.json(), True
+
+
+async def stratpro_file_matches(files_info: dict, image: ImageSource) -> bool:
+    """
+    Whether the file StratPro already has is this image: same size, and the
+    same ETag when both sides report one. Reads a single byte of it.
+    """
+    presigned_get_url = files_info.get("presigned_get_url")
+    if not presigned_get_url:
+        return False
+
+    # A presigned GET does not allow HEAD, a one-byte range tells the size too
+    async with http_clients.session(presigned_get_url).get(
+        presigned_get_url, headers={"Range": "bytes=0-0"}
+    ) as response:
+        if response.status == 206:
+            size = response.headers.get("Content-Range", "").rpartition("/")[2]
+        elif response.status == 200:
+            size = response.headers.get("Content-Length", "")
+        else:
+            return False
+        etag = response.headers.get("ETag", "").strip('"')
+
+    if not size.isdigit() or int(size) != image.size:
+        return False
+    return not etag or not image.etag or etag == image.etag
+
+
+async def upload_image_to_s3(presigned_put_url: str, image: ImageSource):
+    """
+    Stream an image to a presigned StratPro S3 URL.
+
+    Args:
+        presigned_put_url: Upload URL from request_stratpro_file
+        image: Image to upload, streamed from its source
+
+    Raises:
+        HTTPException: If the upload fails
     """
-    Upload image to StratPro S3 storage and return the file key.
+    # Presigned PUTs need the length up front, chunked uploads are rejected
+    async with http_clients.session(presigned_put_url).put(
+        presigned_put_url,
+        data=image.chunks(),
+        headers={
+            "Content-Type": image.content_type,
+            "Content-Length": str(image.size),
+        },
+    ) as upload_response:
+        if upload_response.status != 200:
+            raise await upstream_error(upload_response, "Failed to upload file to S3")
+
+
+async def stage_image_on_stratpro(
+    s3_key: str, image: Optional[ImageSource] = None
+) -> Tuple[str, str]:
+    """
+    Make the image available to StratPro under `s3_key`.
+
+    The token and presigned URLs are requested while our own S3 object is
+    opened, and the upload is skipped when StratPro has the same file already,
+    e.g. from an earlier attempt of the job.
 
     Args:
-        image_path: Path to the image file
-        access_token: Authentication token
+        s3_key: Key of the image in our storage, reused as its name on StratPro
+        image: Image to upload; opened from storage if not given
 
     Returns:
-        str: File key to use in the prediction request
+        (access token, file key to use in the prediction request)
 
     Raises:
         HTTPException: If the upload fails
     """
-    try:
-        headers = {"Authorization": f"Bearer {access_token}"}
 
-        async with aiohttp.ClientSession() as session:
-            # Get presigned URL
-            async with session.put(
-                f"https://platform.stratpro.hse.ru/pu-ocr-qwen-pa-qwen/files/users/{s3_key}",
-                headers=headers,
-            ) as response:
-                if response.status == 400:
-                    async with session.get(
-                        f"https://platform.stratpro.hse.ru/pu-ocr-qwen-pa-qwen/files/users/{s3_key}",
-                        headers=headers,
-                    ) as get_response:
-                        response = get_response
-
-                if response.status not in [200, 201]:
-                    raise HTTPException(
-                        status_code=response.status,
-                        detail=f"Failed to get presigned URL: {await response.text()}",
-                    )
-
-                files_info = await response.json()
-                print(files_info)
-
-            # Upload file to S3
-            with open(image_path, "rb") as f:
-                async with session.put(
-                    files_info["presigned_put_url"], data=f
-                ) as upload_response:
-                    if upload_response.status != 200:
-                        raise HTTPException(
-                            status_code=upload_response.status,
-                            detail=f"Failed to upload file to S3: {await upload_response.text()}",
-                        )
-
-        return s3_key
+    async def files_info() -> Tuple[str, dict, bool]:
+        access_token = await token_manager.get_token()
+        return (access_token, *await request_stratpro_file(s3_key, access_token))
 
+    opened = image is None
+    try:
+        if opened:
+            results = await asyncio.gather(
+                files_info(), ImageSource.from_storage(s3_key), return_exceptions=True
+            )
+            if not isinstance(results[1], BaseException):
+                image = results[1]
+            for result in results:
+                if isinstance(result, BaseException):
+                    raise result
+            access_token, info, existed = results[0]
+        else:
+            access_token, info, existed = await files_info()
+
+        if existed and await stratpro_file_matches(info, image):
+            stratpro_uploads["skipped"] += 1
+        else:
+            await upload_image_to_s3(info["presigned_put_url"], image)
+            stratpro_uploads["uploaded"] += 1
+        return access_token, s3_key
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to upload image to S3: {str(e)}"
         )
+    finally:
+        if opened and image is not None:
+            image.close()
 
 
 async def extract_json_from_image_premise(
-    s3_key: str, image_path: str
+    s3_key: str, image: Optional[ImageSource] = None
 ) -> Dict[str, Any]:
     """
     Extract JSON data from an image using Qwen model via StratPro platform.
 
     Args:
-        image_path: Path to the image file
+        s3_key: Key of the image, reused as its name on StratPro
+        image: Image to extract from; streamed from storage if not given
 
     Returns:
         Dictionary containing the extracted JSON data
@@ -306,10 +571,7 @@ async def extract_json_from_image_premise(
         HTTPException: If the API call fails or returns invalid data
     """
     try:
-        # Get authentication token
-        access_token = await token_manager.get_token()
-        # Upload image to S3 and get file key
-        file_key = await upload_image_to_s3(s3_key, image_path, access_token)
+        access_token, file_key = await stage_image_on_stratpro(s3_key, image)
 
         # Prepare the prompt
         prompt = """
@@ -364,30 +626,32 @@ async def extract_json_from_image_premise(
         headers = {"Authorization": f"Bearer {access_token}"}
 
         print("Going to send request to stratpro")
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                "https://platform.stratpro.hse.ru/pu-ocr-qwen-pa-qwen/qwen/predict",
-                json=payload,
-                headers=headers,
-                timeout=300,
-            ) as response:
-                if response.status == 200:
-                    # Extract the response content
-                    response_data = await response.json()
-                    json_str = response_data["outputs"][0]["data"]
-
-                    # Clean up the response string (remove markdown code block markers)
-                    json_str = (
-                        json_str.replace("```json", "").replace("```", "").strip()
-                    )
-                    print(json_str)
-                    # Parse the JSON response
-                    return json.loads(json_str)
-                else:
-                    raise HTTPException(
-                        status_code=response.status,
-                        detail=f"Failed to extract JSON from image: {await response.text()}",
-                    )
+        url = "https://platform.stratpro.hse.ru/pu-ocr-qwen-pa-qwen/qwen/predict"
+        session = http_clients.session(url)
+        async with session.post(
+            url,
+            json=payload,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=300),
+        ) as response:
+            if response.status == 200:
+                # Extract the response content
+                response_data = await response.json()
+                json_str = response_data["outputs"][0]["data"]
+
+                # Clean up the response string (remove markdown code block markers)
+                json_str = json_str.replace("```json", "").replace("```", "").strip()
+                print(json_str)
+                # Parse the JSON response
+                return json.loads(json_str)
+            else:
+                raise await upstream_error(response, "Failed to extract JSON from image")
+    except HTTPException:
+        raise
+    except json.JSONDecodeError:
+        raise HTTPException(
+            status_code=422, detail="Failed to parse model response as JSON"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Failed to process image: {str(e)}"
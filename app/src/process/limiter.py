@@ -0,0 +1,269 @@
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from .. import metrics
+
+LIMITER_INITIAL = float(os.environ.get("LIMITER_INITIAL", 4))
+LIMITER_MIN = float(os.environ.get("LIMITER_MIN", 1))
+LIMITER_MAX = float(os.environ.get("LIMITER_MAX", 64))
+# Calls allowed to wait for a slot; more are rejected and their jobs deferred
+LIMITER_MAX_QUEUE = int(os.environ.get("LIMITER_MAX_QUEUE", 100))
+# A call this many times slower than the usual latency counts as overload
+LIMITER_LATENCY_TOLERANCE = float(os.environ.get("LIMITER_LATENCY_TOLERANCE", 2.0))
+LIMITER_BACKOFF = float(os.environ.get("LIMITER_BACKOFF", 0.7))
+# Longest Retry-After a call waits out instead of being deferred
+LIMITER_MAX_WAIT = float(os.environ.get("LIMITER_MAX_WAIT", 30))
+# Per-API-key limiters kept at most, see ProviderLimiters
+LIMITER_MAX_KEYS = int(os.environ.get("LIMITER_MAX_KEYS", 1000))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", 30))
+# Weight of a new sample in the moving latency baseline
+BASELINE_ALPHA = 0.05
+DEFAULT_RETRY_AFTER = 1.0
+
+
+class ProviderUnavailable(Exception):
+    """The call was not attempted: the provider is down or throttling us."""
+
+    def __init__(self, provider: str, reason: str, retry_after: float):
+        super().__init__(f"{provider} unavailable: {reason}")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After in seconds, given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit and circuit breaker for one upstream provider.
+
+    The limit grows by one per limit-many fast successes and shrinks
+    multiplicatively (AIMD) on 429s, failures, or calls much slower than the
+    moving latency baseline. A 429 with Retry-After also pauses new calls.
+
+    After BREAKER_FAILURE_THRESHOLD failures in a row the circuit opens and
+    calls are rejected right away; after BREAKER_COOLDOWN one probe call goes
+    through, and its outcome closes or reopens the circuit.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.limit = LIMITER_INITIAL
+        self.in_flight = 0
+        self.state = "closed"
+        self._waiters = deque()
+        self._paused_until = 0.0
+        self._opened_at = 0.0
+        self._probing = False
+        self._failures = 0
+        self._baseline = None
+        self.latency = metrics.LatencyStats()
+        self._counters = {"completed": 0, "failed": 0, "throttled": 0, "rejected": 0}
+
+    def _reject(self, reason: str, retry_after: float):
+        self._counters["rejected"] += 1
+        raise ProviderUnavailable(self.name, reason, retry_after)
+
+    def _enter_breaker(self) -> bool:
+        """Check the circuit; returns True if this call is the half-open probe."""
+        if self.state == "open":
+            remaining = self._opened_at + BREAKER_COOLDOWN - time.monotonic()
+            if remaining > 0:
+                self._reject("circuit open", remaining)
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._probing:
+                self._reject("circuit half-open, probe in flight", BREAKER_COOLDOWN)
+            self._probing = True
+            return True
+        return False
+
+    async def _acquire_slot(self):
+        paused_for = self._paused_until - time.monotonic()
+        if paused_for > LIMITER_MAX_WAIT:
+            self._reject("rate limited", paused_for)
+        if paused_for > 0:
+            await asyncio.sleep(paused_for)
+
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= LIMITER_MAX_QUEUE:
+            self._reject("queue full", DEFAULT_RETRY_AFTER)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # _release hands the slot over, in_flight already counts us
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def _release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _decrease(self):
+        self.limit = max(LIMITER_MIN, self.limit * LIMITER_BACKOFF)
+
+    def _open(self):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        print(f"Circuit for {self.name} opened after {self._failures} failures")
+
+    def _on_success(self, latency: float):
+        self._counters["completed"] += 1
+        self.latency.observe(latency)
+        self._failures = 0
+        if self.state != "closed":
+            print(f"Circuit for {self.name} closed")
+            self.state = "closed"
+
+        if self._baseline is not None and latency > self._baseline * LIMITER_LATENCY_TOLERANCE:
+            self._decrease()
+        else:
+            self.limit = min(LIMITER_MAX, self.limit + 1 / self.limit)
+            self._wake()
+        self._baseline = (
+            latency
+            if self._baseline is None
+            else self._baseline + BASELINE_ALPHA * (latency - self._baseline)
+        )
+
+    def _on_error(self, error: Exception, probe: bool):
+        status = getattr(error, "status_code", None)
+        if status == 429:
+            self._counters["throttled"] += 1
+            self._decrease()
+            headers = getattr(error, "headers", None) or {}
+            retry_after = parse_retry_after(headers.get("Retry-After")) or DEFAULT_RETRY_AFTER
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            if probe:
+                self._open()
+            # Being throttled is not the call's fault, let it be retried later
+            raise ProviderUnavailable(self.name, "rate limited", retry_after) from error
+        elif status is None or status >= 500:
+            self._counters["failed"] += 1
+            self._failures += 1
+            self._decrease()
+            if probe or self._failures >= BREAKER_FAILURE_THRESHOLD:
+                self._open()
+        elif probe:
+            # The provider answered, the request itself was at fault
+            self.state = "closed"
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Hold one concurrency slot around a provider call.
+        Raises ProviderUnavailable instead of calling a provider that is down.
+        """
+        probe = self._enter_breaker()
+        try:
+            await self._acquire_slot()
+        except BaseException:
+            if probe:
+                self._probing = False
+            raise
+
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self._on_error(e, probe)
+            raise
+        else:
+            self._on_success(time.monotonic() - started)
+        finally:
+            if probe:
+                self._probing = False
+            self._release()
+
+    @property
+    def idle(self) -> bool:
+        return self.in_flight == 0 and not self._waiters
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "paused_for": round(max(self._paused_until - time.monotonic(), 0.0), 2),
+            "baseline_latency": round(self._baseline, 3) if self._baseline else None,
+            **self._counters,
+            "latency": self.latency.stats(),
+        }
+
+
+class ProviderLimiters:
+    """
+    One AdaptiveLimiter per provider, created on first use.
+
+    Calls made with a per-user API key get a limiter per key, so one user's
+    rate-limited key does not pause or shrink the provider for everyone.
+    Idle per-key limiters beyond LIMITER_MAX_KEYS are dropped, oldest first.
+    """
+
+    def __init__(self):
+        self._limiters: "OrderedDict[str, AdaptiveLimiter]" = OrderedDict()
+
+    def get(self, provider: str, api_key: Optional[str] = None) -> AdaptiveLimiter:
+        name = provider
+        if api_key:
+            name = f"{provider}:{hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]}"
+        limiter = self._limiters.get(name)
+        if limiter is None:
+            limiter = self._limiters[name] = AdaptiveLimiter(name)
+            self._evict()
+        self._limiters.move_to_end(name)
+        return limiter
+
+    def __getitem__(self, provider: str) -> AdaptiveLimiter:
+        return self.get(provider)
+
+    def _evict(self):
+        excess = len(self._limiters) - LIMITER_MAX_KEYS
+        for name in list(self._limiters):
+            if excess <= 0:
+                break
+            limiter = self._limiters[name]
+            if ":" in name and limiter.idle:
+                del self._limiters[name]
+                excess -= 1
+
+    def stats(self) -> dict:
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+
+provider_limiters = ProviderLimiters()
+metrics.register_collector("providers", provider_limiters.stats)
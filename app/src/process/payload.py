@@ -0,0 +1,116 @@
+import base64
+import hashlib
+import json
+import mimetypes
+from typing import AsyncIterator, Optional, Tuple
+
+from ..storage import storage
+
+# Encoded in slices of this many source bytes, a multiple of 3 so no padding
+# appears before the last slice
+BASE64_SLICE = 48 * 1024
+
+
+class ImageSource:
+    """
+    Image bytes for an upstream request, streamed instead of read whole.
+
+    Either wraps bytes already in memory or an object in S3. Each call to
+    chunks() starts from the beginning, so the same image can be sent again
+    on a retry; for S3 the first pass reuses the body of the initial GET.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        content_type: str,
+        data: bytes = None,
+        s3_key: str = None,
+        etag: Optional[str] = None,
+    ):
+        self.size = size
+        self.content_type = content_type
+        # MD5 of the bytes, as S3 reports it for objects uploaded in one part
+        self.etag = etag
+        self._data = data
+        self._s3_key = s3_key
+        self._body = None
+
+    @classmethod
+    def from_bytes(cls, data: bytes, content_type: str) -> "ImageSource":
+        return cls(len(data), content_type, data=data, etag=hashlib.md5(data).hexdigest())
+
+    @classmethod
+    async def from_storage(cls, s3_key: str) -> "ImageSource":
+        response = await storage.open_object(s3_key)
+        content_type = response.get("ContentType")
+        if not content_type or not content_type.startswith("image/"):
+            content_type = mimetypes.guess_type(s3_key)[0] or "image/jpeg"
+        source = cls(
+            response["ContentLength"],
+            content_type,
+            s3_key=s3_key,
+            etag=response.get("ETag", "").strip('"') or None,
+        )
+        source._body = response["Body"]
+        return source
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        if self._data is not None:
+            yield self._data
+            return
+        body, self._body = self._body, None
+        if body is None:
+            body = (await storage.open_object(self._s3_key))["Body"]
+        async for chunk in storage.iter_body(body):
+            yield chunk
+
+    def close(self):
+        """Release the S3 connection if the body was never read."""
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+
+def base64_size(size: int) -> int:
+    return (size + 2) // 3 * 4
+
+
+async def iter_base64(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Base64-encode a byte stream slice by slice, holding at most one slice."""
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        cut = len(pending) - len(pending) % 3
+        for start in range(0, cut, BASE64_SLICE):
+            yield base64.b64encode(pending[start : min(start + BASE64_SLICE, cut)])
+        pending = pending[cut:]
+    if pending:
+        yield base64.b64encode(pending)
+
+
+def json_with_image(
+    payload: dict, placeholder: str, image: ImageSource, prefix: Optional[str] = None
+) -> Tuple[AsyncIterator[bytes], int]:
+    """
+    Stream `payload` as JSON with the string `placeholder` replaced by the
+    base64 of `image`, optionally preceded by `prefix` (e.g. a data: URL head).
+
+    The JSON around the image is serialized once; the image itself is encoded
+    on the fly, so no full base64 copy or serialized body is ever built.
+
+    Returns:
+        (body chunks, content length)
+    """
+    head, tail = (
+        part.encode("utf-8") for part in json.dumps(payload).split(placeholder, 1)
+    )
+    head += (prefix or "").encode("utf-8")
+
+    async def body():
+        yield head
+        async for chunk in iter_base64(image.chunks()):
+            yield chunk
+        yield tail
+
+    return body(), len(head) + base64_size(image.size) + len(tail)
@@ -0,0 +1,235 @@
+import asyncio
+import hashlib
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, NamedTuple, Tuple
+
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+from .. import metrics
+from .vlm_preprocess import prepare_for_vlm, vlm_config
+
+IMAGE_MAX_SIZE = int(os.environ.get("IMAGE_MAX_SIZE", 1024))
+PREPROCESS_WORKERS = int(os.environ.get("PREPROCESS_WORKERS", os.cpu_count() or 1))
+# Format uploads are re-encoded to: JPEG, WEBP, PNG, or "original" to keep the source format
+IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", 85))
+PERCEPTUAL_HASH_SIZE = 16
+# Fixed renditions derived from every upload, name -> longest side in pixels
+RENDITIONS = {"thumb": 256, "preview": 1024}
+RENDITION_QUALITY = int(os.environ.get("RENDITION_QUALITY", 80))
+
+
+class PreprocessedImage(NamedTuple):
+    data: bytes
+    # what the stored bytes are encoded as, e.g. image/jpeg
+    content_type: str
+    extension: str
+    # size of the upload before normalization
+    original_bytes: int
+    # sha256 of the stored bytes
+    content_hash: str
+    # 256-bit difference hash, hex encoded
+    perceptual_hash: str
+
+
+def _encode(img: PILImage.Image, image_format: str, quality: int) -> bytes:
+    save_args = {"optimize": True}
+    if image_format in ("JPEG", "WEBP"):
+        save_args["quality"] = quality
+    buffer = io.BytesIO()
+    # Nothing is passed for exif/icc_profile, so the metadata is not written
+    img.save(buffer, format=image_format, **save_args)
+    return buffer.getvalue()
+
+
+def normalize_image(
+    image_data: bytes,
+    max_size: int = IMAGE_MAX_SIZE,
+    image_format: str = IMAGE_FORMAT,
+    quality: int = IMAGE_QUALITY,
+) -> Tuple[bytes, str]:
+    """
+    Bring an upload to its stored form: rotate it upright from its EXIF
+    orientation, fit it into max_size, drop EXIF/ICC/text metadata and
+    re-encode it to image_format.
+
+    Returns:
+        (data, format) of the normalized image
+    """
+    img = PILImage.open(io.BytesIO(image_data))
+    source_format = img.format
+    target_format = source_format if image_format == "ORIGINAL" else image_format
+
+    # 0x0112 is the EXIF orientation tag, 1 means already upright
+    changed = img.getexif().get(0x0112, 1) != 1 or max(img.size) > max_size
+
+    img.draft("RGB", (max_size, max_size))
+    img = ImageOps.exif_transpose(img)
+    img.thumbnail((max_size, max_size), PILImage.Resampling.LANCZOS)
+
+    normalized = img
+    if target_format == "JPEG" and img.mode not in ("RGB", "L"):
+        # JPEG has no alpha, flatten transparent areas onto white
+        rgba = img.convert("RGBA")
+        img = PILImage.new("RGB", rgba.size, "white")
+        img.paste(rgba, mask=rgba.getchannel("A"))
+    data = _encode(img, target_format, quality)
+
+    # Flat scans compress far better losslessly, so a PNG stays PNG if JPEG/WebP is bigger
+    if source_format == "PNG" and target_format != "PNG":
+        lossless = _encode(normalized, "PNG", quality)
+        if len(lossless) < len(data):
+            data, target_format = lossless, "PNG"
+
+    # Re-encoding an upright, small enough image must not grow it
+    if not changed and len(data) >= len(image_data):
+        return image_data, source_format
+    return data, target_format
+
+
+def perceptual_hash(image_data: bytes, size: int = PERCEPTUAL_HASH_SIZE) -> str:
+    """
+    Difference hash: compares neighbouring pixels of a tiny grayscale copy,
+    so re-encoded or slightly rescaled copies of an image hash the same.
+    """
+    img = PILImage.open(io.BytesIO(image_data))
+    img.draft("L", (size * 4, size * 4))
+    small = img.convert("L").resize((size + 1, size), PILImage.Resampling.BILINEAR)
+    pixels = small.load()
+
+    bits = 0
+    for y in range(size):
+        for x in range(size):
+            bits = (bits << 1) | int(pixels[x, y] > pixels[x + 1, y])
+    return f"{bits:0{size * size // 4}x}"
+
+
+def preprocess_image(image_data: bytes, max_size: int = IMAGE_MAX_SIZE) -> PreprocessedImage:
+    data, image_format = normalize_image(image_data, max_size)
+    return PreprocessedImage(
+        data=data,
+        content_type=PILImage.MIME.get(image_format, "application/octet-stream"),
+        extension="jpg" if image_format == "JPEG" else image_format.lower(),
+        original_bytes=len(image_data),
+        content_hash=hashlib.sha256(data).hexdigest(),
+        perceptual_hash=perceptual_hash(data),
+    )
+
+
+def render_renditions(
+    image_data: bytes, quality: int = RENDITION_QUALITY
+) -> Dict[str, bytes]:
+    """Encode every entry of RENDITIONS as WebP, decoding the image only once."""
+    img = PILImage.open(io.BytesIO(image_data))
+    img.draft("RGB", (max(RENDITIONS.values()),) * 2)
+    img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+
+    renditions = {}
+    # Largest first, so each smaller rendition is scaled down from the previous one
+    for name, size in sorted(RENDITIONS.items(), key=lambda item: -item[1]):
+        img.thumbnail((size, size), PILImage.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        img.save(buffer, format="WEBP", quality=quality, method=4)
+        renditions[name] = buffer.getvalue()
+    return renditions
+
+
+def _preprocess_in_worker(
+    image_data: bytes, max_size: int, submitted_at: float
+) -> Tuple[PreprocessedImage, float, float]:
+    """Runs in a pool process; returns the result with its queue wait and CPU time."""
+    queue_wait = time.time() - submitted_at
+    cpu_started = time.process_time()
+    result = preprocess_image(image_data, max_size)
+    return result, queue_wait, time.process_time() - cpu_started
+
+
+class ImagePreprocessor:
+    """
+    Runs CPU-bound image preprocessing in a bounded process pool,
+    so decoding, resizing and hashing never hold the event loop.
+    """
+
+    def __init__(self, max_workers: int = PREPROCESS_WORKERS):
+        self.max_workers = max_workers
+        self._executor = None
+        self._queue_wait = metrics.LatencyStats()
+        self._cpu_time = metrics.LatencyStats()
+        self._bytes = {"original_bytes": 0, "stored_bytes": 0}
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn keeps the pool free of the parent's threads and open sockets
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def preprocess(
+        self, image_data: bytes, max_size: int = IMAGE_MAX_SIZE
+    ) -> PreprocessedImage:
+        loop = asyncio.get_running_loop()
+        result, queue_wait, cpu_time = await loop.run_in_executor(
+            self._get_executor(),
+            _preprocess_in_worker,
+            image_data,
+            max_size,
+            time.time(),
+        )
+        self._queue_wait.observe(queue_wait)
+        self._cpu_time.observe(cpu_time)
+        self._bytes["original_bytes"] += result.original_bytes
+        self._bytes["stored_bytes"] += len(result.data)
+        print(
+            f"Preprocessed image: queue wait {queue_wait * 1000:.1f} ms, "
+            f"cpu {cpu_time * 1000:.1f} ms, "
+            f"{result.original_bytes} -> {len(result.data)} bytes as {result.content_type}"
+        )
+        return result
+
+    async def preprocess_many(
+        self, images: List[bytes], max_size: int = IMAGE_MAX_SIZE
+    ) -> List[PreprocessedImage]:
+        """Preprocess all images in parallel, preserving their order."""
+        return await asyncio.gather(
+            *(self.preprocess(data, max_size) for data in images)
+        )
+
+    async def renditions(self, image_data: bytes) -> Dict[str, bytes]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), render_renditions, image_data
+        )
+
+    async def prepare_for_vlm(self, image_data: bytes) -> bytes:
+        """Apply the configured VLM preprocessing steps, a no-op when none are enabled."""
+        if not vlm_config.enabled:
+            return image_data
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_executor(), prepare_for_vlm, image_data, vlm_config
+        )
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "queue_wait": self._queue_wait.stats(),
+            "cpu_time": self._cpu_time.stats(),
+            **self._bytes,
+            "bytes_saved": self._bytes["original_bytes"] - self._bytes["stored_bytes"],
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+preprocessor = ImagePreprocessor()
+metrics.register_collector("preprocessing", preprocessor.stats)
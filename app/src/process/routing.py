@@ -0,0 +1,152 @@
+import asyncio
+import os
+from typing import Dict, List, Optional, Tuple
+
+from .. import metrics
+from .image_processor import (
+    LOCAL_INFERENCE_URL,
+    PROMPT_VERSIONS,
+    extract_json_from_image_cloud,
+    extract_json_from_image_local,
+    extract_json_from_image_premise,
+    token_manager,
+)
+from .limiter import ProviderUnavailable, provider_limiters
+from .payload import ImageSource
+
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "true").lower() == "true"
+# Secondary provider of each workload, as workload:provider pairs. Failing over
+# from on_premise or local to cloud sends their images to OpenRouter on the
+# user's own key, so a deployment has to opt in with e.g. "on_premise:cloud".
+PROVIDER_FAILOVER = dict(
+    pair.split(":", 1)
+    for pair in os.environ.get("PROVIDER_FAILOVER", "cloud:on_premise").split(",")
+    if ":" in pair
+)
+# The secondary is started once the primary runs longer than this percentile of its latency
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", 0.9))
+# Until the primary has this many samples, HEDGE_DEFAULT_DELAY is used instead
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", 20))
+HEDGE_DEFAULT_DELAY = float(os.environ.get("HEDGE_DEFAULT_DELAY", 30))
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", 1))
+
+routing_counters = {
+    "single": 0,
+    "hedges": 0,
+    "failovers": 0,
+    "primary_wins": 0,
+    "secondary_wins": 0,
+}
+metrics.register_collector("routing", lambda: dict(routing_counters))
+
+
+def available(provider: str, cloud_key: Optional[str]) -> bool:
+    """Whether the provider can serve this job at all."""
+    if provider == "cloud":
+        return bool(cloud_key)
+    if provider == "on_premise":
+        return bool(token_manager.client_id)
+    return provider == "local" and bool(LOCAL_INFERENCE_URL)
+
+
+def enabled_workloads() -> List[str]:
+    """Workloads this deployment serves; cloud also needs the user's own key."""
+    return [
+        workload
+        for workload in PROMPT_VERSIONS
+        if workload == "cloud" or available(workload, None)
+    ]
+
+
+def limiter_for(provider: str, cloud_key: Optional[str]):
+    # Cloud calls run on each user's own key, which is rate-limited on its own
+    return provider_limiters.get(provider, cloud_key if provider == "cloud" else None)
+
+
+def hedge_delay(provider: str, cloud_key: Optional[str]) -> float:
+    latency = limiter_for(provider, cloud_key).latency
+    if latency.count < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_DELAY
+    return max(HEDGE_MIN_DELAY, latency.percentile(HEDGE_PERCENTILE))
+
+
+async def extract_with(
+    provider: str, s3_key: str, cloud_key: Optional[str], image: Optional[ImageSource]
+) -> dict:
+    """
+    One extraction attempt within the provider's concurrency limit.
+    Without a prepared image the S3 body is opened once a slot is free;
+    the premise path opens it itself, alongside its token and URL requests.
+    """
+    async with limiter_for(provider, cloud_key).slot():
+        if provider == "on_premise":
+            return await extract_json_from_image_premise(s3_key, image)
+        source = image or await ImageSource.from_storage(s3_key)
+        try:
+            if provider == "cloud":
+                return await extract_json_from_image_cloud(source, cloud_key)
+            return await extract_json_from_image_local(source)
+        finally:
+            if image is None:
+                source.close()
+
+
+async def route_extraction(
+    workload: str,
+    s3_key: str,
+    cloud_key: Optional[str],
+    image: Optional[ImageSource] = None,
+) -> Tuple[dict, str]:
+    """
+    Extract with the workload's provider, hedged by its secondary.
+
+    The secondary starts when the primary fails, or when it is still running
+    after the primary's rolling HEDGE_PERCENTILE latency. The first valid
+    result wins and the other attempt is cancelled.
+
+    Returns:
+        (extracted data, provider that served it)
+    """
+    secondary = PROVIDER_FAILOVER.get(workload)
+    if not HEDGE_ENABLED or secondary is None or not available(secondary, cloud_key):
+        routing_counters["single"] += 1
+        return await extract_with(workload, s3_key, cloud_key, image), workload
+
+    tasks: Dict[asyncio.Task, str] = {
+        asyncio.create_task(extract_with(workload, s3_key, cloud_key, image)): workload
+    }
+    errors = []
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_delay(workload, cloud_key))
+        for task in done:
+            tasks.pop(task)
+            if task.exception() is None:
+                routing_counters["primary_wins"] += 1
+                return task.result(), workload
+            errors.append(task.exception())
+
+        routing_counters["failovers" if errors else "hedges"] += 1
+        print(
+            f"{'Failing over' if errors else 'Hedging'} {s3_key} from {workload} to {secondary}"
+        )
+        tasks[asyncio.create_task(extract_with(secondary, s3_key, cloud_key, image))] = secondary
+
+        while tasks:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                provider = tasks.pop(task)
+                if task.exception() is None:
+                    routing_counters[
+                        "primary_wins" if provider == workload else "secondary_wins"
+                    ] += 1
+                    return task.result(), provider
+                errors.append(task.exception())
+    finally:
+        # The losing attempt is cancelled, which also frees its limiter slot
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # Both failed: a real failure counts against the job, throttling only defers it
+    failures = [e for e in errors if not isinstance(e, ProviderUnavailable)]
+    raise (failures or errors)[0]
@@ -7,13 +7,18 @@ from datetime import datetime
 class ImageUploadResponse(BaseModel):
     image_id: str
     status: str
+    original_bytes: Optional[int] = None
+    stored_bytes: Optional[int] = None
+    bytes_saved: Optional[int] = None
 
 
 class ImageStatus(BaseModel):
     image_id: str
     s3_key: str
     status: str
-    result_json: str
+    result_json: Optional[str] = None
+    # provider that produced result_json, set once extraction finished
+    served_by: Optional[str] = None
     created_at: datetime
 
 
@@ -25,3 +30,8 @@ class PaginatedImageResponse(BaseModel):
 class ImageListParams(BaseModel):
     cursor: Optional[str] = None
     limit: int = 10
+    include_result: bool = True
+
+
+class ImageStatusBatchParams(BaseModel):
+    image_ids: List[str]
@@ -0,0 +1,139 @@
+import io
+import os
+from typing import NamedTuple
+
+import numpy as np
+from PIL import Image as PILImage
+
+# Comma separated steps applied before an image is sent to a model,
+# any of: crop, grayscale, deskew, contrast. Empty disables the stage.
+VLM_PREPROCESS = os.environ.get("VLM_PREPROCESS", "")
+VLM_QUALITY = int(os.environ.get("VLM_QUALITY", 85))
+# Deskew searches this many degrees either way
+DESKEW_MAX_ANGLE = float(os.environ.get("DESKEW_MAX_ANGLE", 10))
+
+STEPS = ("crop", "grayscale", "deskew", "contrast")
+
+
+class VLMPreprocessConfig(NamedTuple):
+    crop: bool = False
+    grayscale: bool = False
+    deskew: bool = False
+    contrast: bool = False
+
+    @classmethod
+    def parse(cls, value: str) -> "VLMPreprocessConfig":
+        steps = {step.strip().lower() for step in value.split(",") if step.strip()}
+        steps.discard("none")
+        unknown = steps - set(STEPS)
+        if unknown:
+            raise ValueError(f"Unknown VLM preprocessing steps: {', '.join(sorted(unknown))}")
+        return cls(**{step: True for step in steps})
+
+    @property
+    def enabled(self) -> bool:
+        return any(self)
+
+    @property
+    def key(self) -> str:
+        """Stable name of the configuration, e.g. crop+deskew, or none."""
+        return "+".join(step for step in STEPS if getattr(self, step)) or "none"
+
+
+vlm_config = VLMPreprocessConfig.parse(VLM_PREPROCESS)
+
+
+def crop_receipt(img: PILImage.Image, threshold: int = 40, margin: float = 0.02) -> PILImage.Image:
+    """
+    Crop to the region that differs from the background.
+    The background level is taken from the image border; rows and columns
+    where enough pixels stand out from it bound the receipt.
+    """
+    gray = np.asarray(img.convert("L"), dtype=np.int16)
+    border = np.concatenate([gray[0], gray[-1], gray[:, 0], gray[:, -1]])
+    foreground = np.abs(gray - np.median(border)) > threshold
+
+    rows = np.flatnonzero(foreground.mean(axis=1) > 0.02)
+    cols = np.flatnonzero(foreground.mean(axis=0) > 0.02)
+    if rows.size == 0 or cols.size == 0:
+        return img
+
+    height, width = gray.shape
+    pad_y, pad_x = int(height * margin), int(width * margin)
+    box = (
+        max(cols[0] - pad_x, 0),
+        max(rows[0] - pad_y, 0),
+        min(cols[-1] + pad_x + 1, width),
+        min(rows[-1] + pad_y + 1, height),
+    )
+    # Keep the original if the detected region is implausibly small
+    if (box[2] - box[0]) * (box[3] - box[1]) < 0.1 * width * height:
+        return img
+    return img.crop(box)
+
+
+def estimate_skew(img: PILImage.Image, max_angle: float = DESKEW_MAX_ANGLE) -> float:
+    """
+    Projection-profile skew estimate: text lines are horizontal when the
+    row sums of the binarized image vary the most.
+    """
+    small = img.convert("L")
+    small.thumbnail((512, 512))
+    gray = np.asarray(small, dtype=np.uint8)
+    # Dark ink on light paper becomes white on black, so rotation fills with 0
+    ink = PILImage.fromarray(((gray < gray.mean() - gray.std() / 2) * 255).astype(np.uint8))
+
+    def score(angle: float) -> float:
+        rotated = np.asarray(ink.rotate(angle, resample=PILImage.Resampling.NEAREST))
+        return float(np.var(rotated.sum(axis=1, dtype=np.int64)))
+
+    # Coarse search in whole degrees, then refine around the best one
+    best = max(np.arange(-max_angle, max_angle + 1, 1.0), key=score)
+    return float(max(np.arange(best - 1, best + 1.05, 0.1), key=score))
+
+
+def deskew(img: PILImage.Image, max_angle: float = DESKEW_MAX_ANGLE) -> PILImage.Image:
+    angle = estimate_skew(img, max_angle)
+    if abs(angle) < 0.2:
+        return img
+    fill = 255 if img.mode == "L" else (255,) * len(img.getbands())
+    return img.rotate(
+        angle, resample=PILImage.Resampling.BICUBIC, expand=True, fillcolor=fill
+    )
+
+
+def normalize_contrast(img: PILImage.Image, low: float = 1, high: float = 99) -> PILImage.Image:
+    """Stretch the low..high percentile range of every channel to 0..255."""
+    pixels = np.asarray(img, dtype=np.float32)
+    lo, hi = np.percentile(pixels, [low, high])
+    if hi - lo < 1:
+        return img
+    stretched = np.clip((pixels - lo) * (255.0 / (hi - lo)), 0, 255).astype(np.uint8)
+    return PILImage.fromarray(stretched)
+
+
+def prepare_for_vlm(
+    image_data: bytes, config: VLMPreprocessConfig = vlm_config, quality: int = VLM_QUALITY
+) -> bytes:
+    """
+    Apply the enabled steps and re-encode in the source format,
+    so the file name and content type sent upstream stay valid.
+    """
+    if not config.enabled:
+        return image_data
+
+    img = PILImage.open(io.BytesIO(image_data))
+    image_format = img.format
+    img = img.convert("L" if config.grayscale else "RGB")
+
+    if config.crop:
+        img = crop_receipt(img)
+    if config.deskew:
+        img = deskew(img)
+    if config.contrast:
+        img = normalize_contrast(img)
+
+    buffer = io.BytesIO()
+    save_args = {"quality": quality} if image_format in ("JPEG", "WEBP") else {}
+    img.save(buffer, format=image_format, optimize=True, **save_args)
+    return buffer.getvalue()
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+
+from .. import metrics
+from ..models.connector import connector
+from ..models.extraction_cache import ExtractionCache
+from ..models.image import Image
+from ..models.job import Job
+from ..models.user import get_cloud_key
+from ..storage import storage, rendition_key
+from .preprocess import RENDITIONS, preprocessor
+from .limiter import ProviderUnavailable
+from .payload import ImageSource
+from .routing import PROVIDER_FAILOVER, route_extraction
+from .vlm_preprocess import vlm_config
+from .image_processor import PROMPT_VERSIONS
+
+EXTRACTION_CONCURRENCY = int(os.environ.get("EXTRACTION_CONCURRENCY", 4))
+JOB_VISIBILITY_TIMEOUT = int(os.environ.get("JOB_VISIBILITY_TIMEOUT", 600))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", 1.0))
+JOB_RETRY_BACKOFF = int(os.environ.get("JOB_RETRY_BACKOFF", 30))
+JOB_SHUTDOWN_TIMEOUT = float(os.environ.get("JOB_SHUTDOWN_TIMEOUT", 30))
+# Deferrals without using up an attempt; after that throttling counts as a failure
+JOB_MAX_DEFERRALS = int(os.environ.get("JOB_MAX_DEFERRALS", 10))
+# Workers serve no HTTP, so their metrics snapshot goes to the log instead
+METRICS_LOG_INTERVAL = float(os.environ.get("METRICS_LOG_INTERVAL", 60))
+
+dedup_counters = {"exact_hits": 0, "perceptual_hits": 0, "misses": 0, "unhashed": 0}
+
+
+def dedup_stats() -> dict:
+    hits = dedup_counters["exact_hits"] + dedup_counters["perceptual_hits"]
+    lookups = hits + dedup_counters["misses"]
+    return {**dedup_counters, "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
+
+
+metrics.register_collector("dedup", dedup_stats)
+
+
+def prompt_version(provider: str) -> str:
+    version = PROMPT_VERSIONS[provider]
+    if vlm_config.enabled:
+        # The model sees a different image, so it may answer differently
+        version = f"{version}/{vlm_config.key}"
+    return version
+
+
+async def background_processing(
+    image_id: str,
+    user_id: str,
+    s3_key: str,
+    workload: str,
+    cloud_key: str,
+    content_hash: str = None,
+    perceptual_hash: str = None,
+):
+    image_model = Image()
+    extraction_cache = ExtractionCache()
+
+    # Update status to in_process
+    await image_model.update_status(image_id, "in_process")
+
+    # Reuse the result of an identical image instead of calling the provider again
+    if content_hash is None:
+        dedup_counters["unhashed"] += 1
+    else:
+        cached = await extraction_cache.get(
+            content_hash, perceptual_hash, user_id, workload, prompt_version(workload)
+        )
+        if cached is not None:
+            result_json, match = cached
+            dedup_counters[f"{match}_hits"] += 1
+            print(f"Reused {match} duplicate extraction for image {image_id}")
+            await image_model.update_status(image_id, "finished", result_json, "cache")
+            return
+        dedup_counters["misses"] += 1
+
+    # The image goes from the S3 body straight into the request, never to disk;
+    # without preprocessing every attempt streams its own S3 body
+    image = None
+    if vlm_config.enabled:
+        image_data, content_type = await storage.get_object(s3_key)
+        image = ImageSource.from_bytes(
+            await preprocessor.prepare_for_vlm(image_data), content_type
+        )
+        del image_data
+
+    # Process image and extract JSON, failing over or hedging to another provider
+    extracted_data, served_by = await route_extraction(workload, s3_key, cloud_key, image)
+
+    if content_hash is not None:
+        await extraction_cache.put(
+            content_hash,
+            perceptual_hash,
+            user_id,
+            served_by,
+            prompt_version(served_by),
+            extracted_data,
+        )
+    # Update status to finished
+    await image_model.update_status(image_id, "finished", extracted_data, served_by)
+
+
+async def generate_renditions(image_id: str, s3_key: str):
+    """
+    Store the thumbnail and preview of an image next to the original.
+    Best effort: until they exist /get-image serves the original instead.
+    """
+    try:
+        # A retried job may already have them, unless its earlier upload stopped halfway
+        stored = await asyncio.gather(
+            *(storage.exists(rendition_key(s3_key, name)) for name in RENDITIONS)
+        )
+        if not all(stored):
+            image_data, _ = await storage.get_object(s3_key)
+            renditions = await preprocessor.renditions(image_data)
+            await storage.upload_many(
+                (rendition_key(s3_key, name), data, "image/webp")
+                for name, data in renditions.items()
+            )
+        # Lets presigned URLs pick the rendition without asking S3 first
+        await Image().set_renditions_ready(image_id)
+    except Exception as e:
+        print(f"Failed to generate renditions for image {image_id}: {e}")
+
+
+class ExtractionWorker:
+    """
+    Pulls extraction jobs from app.jobs and runs them with bounded concurrency.
+
+    Jobs are claimed with FOR UPDATE SKIP LOCKED, so any number of workers
+    can share the queue. A claimed job is hidden from other workers until its
+    visibility timeout expires; the worker keeps extending it while the job
+    runs, so a job is only picked up again if its worker dies.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = EXTRACTION_CONCURRENCY,
+        visibility_timeout: int = JOB_VISIBILITY_TIMEOUT,
+        poll_interval: float = JOB_POLL_INTERVAL,
+    ):
+        self.worker_id = f"{socket.gethostname()}-{uuid.uuid4().hex[:8]}"
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.job_model = Job()
+        self.image_model = Image()
+        self._tasks = set()
+        self._stopping = asyncio.Event()
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        print(
+            f"Extraction worker {self.worker_id} started with concurrency {self.concurrency}"
+        )
+        metrics_logged_at = time.monotonic()
+        while not self._stopping.is_set():
+            if time.monotonic() - metrics_logged_at >= METRICS_LOG_INTERVAL:
+                print(f"Worker metrics: {json.dumps(metrics.snapshot())}")
+                metrics_logged_at = time.monotonic()
+
+            claimed = 0
+            try:
+                await self.job_model.fail_expired()
+                free_slots = self.concurrency - len(self._tasks)
+                if free_slots > 0:
+                    jobs = await self.job_model.claim(
+                        self.worker_id, free_slots, self.visibility_timeout
+                    )
+                    claimed = len(jobs)
+                    for job in jobs:
+                        task = asyncio.create_task(self._run_job(job))
+                        self._tasks.add(task)
+                        task.add_done_callback(self._tasks.discard)
+            except Exception as e:
+                print(f"Failed to claim jobs: {e}")
+
+            # Poll again right away while the queue keeps filling our free slots
+            if claimed and len(self._tasks) < self.concurrency:
+                continue
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+        await self._drain()
+        print(f"Extraction worker {self.worker_id} stopped")
+
+    async def _drain(self):
+        """Give in-flight jobs a chance to finish; the rest are cancelled and released."""
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(self._tasks, timeout=JOB_SHUTDOWN_TIMEOUT)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    async def _heartbeat(self, job_id: str):
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                await self.job_model.touch(job_id, self.worker_id, self.visibility_timeout)
+            except Exception as e:
+                print(f"Failed to extend visibility of job {job_id}: {e}")
+
+    async def _run_job(self, job):
+        heartbeat = asyncio.create_task(self._heartbeat(job.id))
+        try:
+            cloud_key = None
+            # The user's key is also needed when cloud is the failover provider
+            if "cloud" in (job.workload, PROVIDER_FAILOVER.get(job.workload)):
+                async with connector.engine.begin() as conn:
+                    user = await get_cloud_key(conn, job.user_id)
+                    cloud_key = user.cloud_key if user else None
+
+            # Renditions are built from the stored original while extraction runs
+            renditions = asyncio.create_task(generate_renditions(job.image_id, job.s3_key))
+            try:
+                await background_processing(
+                    job.image_id,
+                    job.user_id,
+                    job.s3_key,
+                    job.workload,
+                    cloud_key,
+                    job.content_hash,
+                    job.perceptual_hash,
+                )
+                await renditions
+            finally:
+                # A failed or cancelled job must not leave its renditions running,
+                # its retry starts them again
+                if not renditions.done():
+                    renditions.cancel()
+                    await asyncio.gather(renditions, return_exceptions=True)
+            if not await self.job_model.complete(job.id, self.worker_id):
+                print(f"Job {job.id} finished after its claim was lost")
+        except asyncio.CancelledError:
+            # Shutdown: hand the job back so another worker picks it up right away
+            # instead of after the visibility timeout
+            try:
+                await self.job_model.release(job.id, self.worker_id)
+            except Exception as e:
+                print(f"Failed to release job {job.id}: {e}")
+            raise
+        except ProviderUnavailable as e:
+            if job.deferrals < JOB_MAX_DEFERRALS:
+                # The provider was never really tried, so the attempt does not count
+                print(f"Job {job.id} deferred for {e.retry_after:.0f} s: {e}")
+                await self.job_model.defer(job.id, self.worker_id, str(e), e.retry_after)
+            else:
+                await self._fail_attempt(job, e)
+        except Exception as e:
+            await self._fail_attempt(job, e)
+        finally:
+            heartbeat.cancel()
+
+    async def _fail_attempt(self, job, e: Exception):
+        error = str(e)
+        if job.attempts >= job.max_attempts:
+            print(f"Job {job.id} failed permanently: {error}")
+            # Another worker took the job over, the image is its business now
+            if await self.job_model.fail(job.id, self.worker_id, error):
+                await self.image_model.update_error(job.image_id, error)
+        else:
+            print(f"Job {job.id} failed on attempt {job.attempts}: {error}")
+            await self.job_model.retry(
+                job.id, self.worker_id, error, JOB_RETRY_BACKOFF * job.attempts
+            )
@@ -9,11 +9,11 @@ auth_router = APIRouter(tags=["auth"])
 
 @auth_router.post("/register", response_model=TokenOut)
 async def register(user_input: UserRegisterIn):
-    with connector.engine.begin() as conn:
-        if user.get_user_by_email(conn, user_input.email):
+    async with connector.engine.begin() as conn:
+        if await user.get_user_by_email(conn, user_input.email):
             raise HTTPException(status_code=400, detail="Email already registered")
 
-        new_user = user.create_user(conn, user_input.email, user_input.password)
+        new_user = await user.create_user(conn, user_input.email, user_input.password)
         access_token = security.create_access_token({"sub": str(new_user.id)})
         refresh_token = security.create_refresh_token({"sub": str(new_user.id)})
 
@@ -22,8 +22,8 @@ async def register(user_input: UserRegisterIn):
 
 @auth_router.post("/login", response_model=TokenOut)
 async def login(user_input: UserLoginIn):
-    with connector.engine.begin() as conn:
-        db_user = user.get_user_by_email(conn, user_input.email)
+    async with connector.engine.begin() as conn:
+        db_user = await user.get_user_by_email(conn, user_input.email)
         if not db_user or not user.verify_password(
             user_input.password, db_user.hashed_password
         ):
@@ -1,55 +1,149 @@
-from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import StreamingResponse
-import io
+from fastapi import APIRouter, HTTPException, Depends, Header, Request, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
 import json
-from typing import Dict, Any
+import os
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Any, List, Literal, Optional
 
+from botocore.exceptions import ClientError
 from pydantic import BaseModel
 
-from ..bucket_init import s3, bucket_name
+from ..storage import storage, rendition_key, S3_PRESIGN_EXPIRES
 from ..auth.security import get_current_user
 from ..models.image import Image
 
 image_router = APIRouter(tags=["Image"])
 
+# Stored objects never change under their key, so browsers may keep them
+IMAGE_CACHE_MAX_AGE = int(os.environ.get("IMAGE_CACHE_MAX_AGE", 86400))
+MAX_PRESIGN_BATCH = 100
+
 class ImageUpdate(BaseModel):
     image_id: str
     json_data: str
 
+Rendition = Literal["thumb", "preview"]
+
+class ImageUrlsRequest(BaseModel):
+    image_ids: List[str]
+    rendition: Optional[Rendition] = None
+
+def _object_key(s3_key: str, rendition: Optional[str]):
+    """Key and download filename of the original or one of its renditions."""
+    filename = s3_key.split("/")[-1]
+    if rendition is None:
+        return s3_key, filename
+    return rendition_key(s3_key, rendition), f'{filename.rsplit(".", 1)[0]}.{rendition}.webp'
+
+def _presign(image: dict, rendition: Optional[str] = None) -> str:
+    # Renditions are generated after upload, until then point at the original
+    if not image["renditions_ready"]:
+        rendition = None
+    key, filename = _object_key(image["s3_key"], rendition)
+    return storage.presign_get(key, filename=filename)
+
+def _parse_http_date(value: Optional[str]):
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
 @image_router.get("/get-image")
-async def get_image(image_id: str):
+async def get_image(
+    request: Request,
+    image_id: str,
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    if_modified_since: Optional[str] = Header(None),
+    mode: Literal["stream", "url", "redirect"] = "stream",
+    rendition: Optional[Rendition] = None,
+):
+    if mode != "stream":
+        # Hand out a short-lived S3 URL so the bytes never pass through the app
+        current_user = await get_current_user(request)
+        images = await Image().get_by_ids([image_id], current_user)
+        if not images:
+            raise HTTPException(status_code=404, detail="Image not found")
+        url = _presign(images[0], rendition)
+        if mode == "redirect":
+            return RedirectResponse(url, status_code=307)
+        return {"url": url, "expires_in": S3_PRESIGN_EXPIRES}
+
+    conditions = {
+        "Range": range_header,
+        "IfNoneMatch": if_none_match,
+        "IfModifiedSince": _parse_http_date(if_modified_since),
+    }
     try:
         image_model = Image()
-        image = image_model.get_by_id(image_id)
-        # Get the image from S3
-        response = s3.get_object(Bucket=bucket_name, Key=image.s3_key)
-
-        # Extract original filename from s3_key
-        original_filename = image.s3_key.split("/")[-1]
-
-        # Create a streaming response with filename in headers
-        return StreamingResponse(
-            io.BytesIO(response["Body"].read()),
-            media_type=response["ContentType"],
-            headers={
-                "Content-Disposition": f'attachment; filename="{original_filename}"'
-            },
-        )
+        image = await image_model.get_by_id(image_id)
+        key, filename = _object_key(image.s3_key, rendition)
+        # Start the S3 GET; the body is streamed below, never held in memory
+        try:
+            response = await storage.open_object(key, **conditions)
+        except ClientError as e:
+            # Renditions are generated after upload, until then serve the original
+            if rendition is None or e.response["ResponseMetadata"]["HTTPStatusCode"] != 404:
+                raise
+            key, filename = _object_key(image.s3_key, None)
+            response = await storage.open_object(key, **conditions)
+    except ClientError as e:
+        status_code = e.response["ResponseMetadata"]["HTTPStatusCode"]
+        if status_code == 304:
+            etag = e.response["ResponseMetadata"].get("HTTPHeaders", {}).get("etag")
+            return Response(status_code=304, headers={"ETag": etag} if etag else None)
+        if status_code == 416:
+            raise HTTPException(status_code=416, detail="Requested range not satisfiable")
+        raise HTTPException(status_code=404, detail=f"Image not found: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=404, detail=f"Image not found: {str(e)}")
 
+    headers = {
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "Content-Length": str(response["ContentLength"]),
+        "Accept-Ranges": "bytes",
+        "ETag": response["ETag"],
+        "Last-Modified": format_datetime(response["LastModified"], usegmt=True),
+        "Cache-Control": f"private, max-age={IMAGE_CACHE_MAX_AGE}",
+    }
+    if response.get("ContentRange"):
+        headers["Content-Range"] = response["ContentRange"]
+
+    # Stream the S3 body chunk by chunk with filename in headers
+    return StreamingResponse(
+        storage.iter_body(response["Body"]),
+        status_code=206 if response.get("ContentRange") else 200,
+        media_type=response["ContentType"],
+        headers=headers,
+    )
+
+@image_router.post("/images/urls")
+async def get_image_urls(body: ImageUrlsRequest, current_user: str = Depends(get_current_user)):
+    """Presigned GET URLs for a batch of the user's images; unknown ids are left out."""
+    if len(body.image_ids) > MAX_PRESIGN_BATCH:
+        raise HTTPException(
+            status_code=400, detail=f"Maximum {MAX_PRESIGN_BATCH} images allowed."
+        )
+    images = await Image().get_by_ids(body.image_ids, current_user)
+    return {
+        "urls": {image["image_id"]: _presign(image, body.rendition) for image in images},
+        "expires_in": S3_PRESIGN_EXPIRES,
+    }
+
 @image_router.put("/update-image-json")
 async def update_image_json(image_update: ImageUpdate, _: dict = Depends(get_current_user)):
     try:
         image_model = Image()
-        image = image_model.get_by_id(image_update.image_id)
+        image = await image_model.get_by_id(image_update.image_id)
         
         if not image:
             raise HTTPException(status_code=404, detail="Image not found")
             
         # Update the image JSON data
 
-        image_model.update_status(image_update.image_id, image.status, json.loads(image_update.json_data))
+        await image_model.update_status(image_update.image_id, image.status, json.loads(image_update.json_data))
         
         return {"status": "success", "message": "Image JSON updated successfully"}
     except Exception as e:
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+
+from .. import metrics
+
+metrics_router = APIRouter(tags=["metrics"])
+
+
+@metrics_router.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
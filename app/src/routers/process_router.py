@@ -1,4 +1,3 @@
-import os
 import uuid
 from fastapi import (
     APIRouter,
@@ -6,161 +5,106 @@ from fastapi import (
     File,
     Depends,
     HTTPException,
-    BackgroundTasks,
     Query,
+    WebSocket,
 )
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from typing import List
-import boto3
-import tempfile
-from PIL import Image as PILImage
-import io
-import asyncio
 
-from ..auth.security import get_current_user
+from ..auth.security import get_current_user, get_stream_user, verify_token
 from ..process.schemas import (
     ImageUploadResponse,
     ImageStatus,
     PaginatedImageResponse,
     ImageListParams,
+    ImageStatusBatchParams,
 )
 from ..models.image import Image
 from ..models.user import get_cloud_key
-from ..process.image_processor import (
-    extract_json_from_image_cloud,
-    extract_json_from_image_premise,
-)
 from ..models.connector import connector
+from ..process.preprocess import preprocessor
+from ..process.image_processor import PROMPT_VERSIONS
+from ..process.routing import enabled_workloads
+from ..storage import storage
+from ..status_events import sse_stream, websocket_stream
 
 process_router = APIRouter(tags=["process"])
 
-# S3 client config
-s3 = boto3.client(
-    "s3",
-    endpoint_url=os.environ["S3_ENDPOINT"],
-    aws_access_key_id=os.environ["S3_ACCESS_KEY"],
-    aws_secret_access_key=os.environ["S3_SECRET_KEY"],
-)
-S3_BUCKET = os.environ["S3_BUCKET"]
+MAX_STATUS_BATCH = 100
 
 
-def resize_image(image_data: bytes, max_size: int = 1024) -> bytes:
-    """
-    Resize image maintaining aspect ratio, ensuring no side exceeds max_size.
-
-    Args:
-        image_data: Original image data in bytes
-        max_size: Maximum size for width and height (default: 1024)
-
-    Returns:
-        bytes: Resized image data
-    """
-    # Open image from bytes
-    img = PILImage.open(io.BytesIO(image_data))
-
-    # Calculate new dimensions maintaining aspect ratio
-    width, height = img.size
-    if width > height:
-        if width > max_size:
-            new_width = max_size
-            new_height = int(height * (max_size / width))
-        else:
-            return image_data
-    else:
-        if height > max_size:
-            new_height = max_size
-            new_width = int(width * (max_size / height))
-        else:
-            return image_data
-
-    # Resize image
-    resized_img = img.resize((new_width, new_height), PILImage.Resampling.LANCZOS)
-
-    # Convert back to bytes
-    img_byte_arr = io.BytesIO()
-    resized_img.save(img_byte_arr, format=img.format)
-    return img_byte_arr.getvalue()
-
-
-async def background_processing(
-    image_id: str, s3_key: str, workload: str, cloud_key: str
-):
-    image_model = Image()
-    try:
-        # Update status to in_process
-        print("Updated to in_process")
-        image_model.update_status(image_id, "in_process")
-
-        # Download image from S3 to temporary file
-        with tempfile.NamedTemporaryFile(
-            suffix=f'.{s3_key.split(".")[-1]}', delete=False
-        ) as temp_file:
-            s3.download_file(S3_BUCKET, s3_key, temp_file.name)
-
-            # Process image and extract JSON
-            if workload == "cloud":
-                extracted_data = await extract_json_from_image_cloud(
-                    temp_file.name, cloud_key
-                )
-            else:
-                extracted_data = await extract_json_from_image_premise(
-                    s3_key, temp_file.name
-                )
-            # Update status to finished
-            image_model.update_status(image_id, "finished", extracted_data)
-
-    except Exception as e:
-        # Update status to error if something goes wrong
-        image_model.update_status(image_id, "error")
-        image_model.update_error(image_id, str(e))
-        raise
+@process_router.get("/workloads")
+async def get_workloads(current_user: str = Depends(get_current_user)):
+    """Workloads uploads may ask for on this server."""
+    return {"workloads": enabled_workloads()}
 
 
 @process_router.post("/upload-images", response_model=List[ImageUploadResponse])
 async def upload_images(
-    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
     workload: str = "cloud",
     current_user: str = Depends(get_current_user),
 ):
     if len(files) > 5:
         raise HTTPException(status_code=400, detail="Maximum 5 files allowed.")
-    cloud_key = None
+    if workload not in PROMPT_VERSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown workload, expected one of: {', '.join(PROMPT_VERSIONS)}.",
+        )
+    if workload not in enabled_workloads():
+        raise HTTPException(
+            status_code=400,
+            detail=f"Workload {workload} is not enabled on this server.",
+        )
     if workload == "cloud":
-        # Check if user has cloud key set
-        with connector.engine.begin() as conn:
-            user = get_cloud_key(conn, current_user)
+        # Check if user has cloud key set, the worker reads it again when the job runs
+        async with connector.engine.begin() as conn:
+            user = await get_cloud_key(conn, current_user)
             if not user or not user.cloud_key:
                 raise HTTPException(
                     status_code=400,
                     detail="Cloud key not set for this user. Please set your OpenRouter API key first.",
                 )
-            cloud_key = user.cloud_key
 
     image_model = Image()
     results = []
 
-    for file in files:
-        file_id = str(uuid.uuid4())
-        s3_key = f"{current_user}/{file_id}/{file.filename}"
-
-        # Read file content
-        file_content = await file.read()
-
-        # Resize image if needed
-        resized_content = resize_image(file_content)
-
-        # Upload to S3
-        s3.upload_fileobj(io.BytesIO(resized_content), S3_BUCKET, s3_key)
-
-        # Create image record
-        result = image_model.create(current_user, s3_key, workload)
-        results.append(
-            ImageUploadResponse(image_id=result["id"], status=result["status"])
+    # Read file content
+    contents = [await file.read() for file in files]
+
+    # Resize and hash images, all files in parallel in the process pool
+    preprocessed = await preprocessor.preprocess_many(contents)
+
+    # The stored name carries the extension of the normalized format
+    s3_keys = [
+        f"{current_user}/{uuid.uuid4()}/{file.filename.rsplit('.', 1)[0]}.{image.extension}"
+        for file, image in zip(files, preprocessed)
+    ]
+
+    # Upload all files to S3 at once
+    await storage.upload_many(
+        (s3_key, image.data, image.content_type)
+        for s3_key, image in zip(s3_keys, preprocessed)
+    )
+
+    for s3_key, image in zip(s3_keys, preprocessed):
+        # Create image record, the extraction worker picks up its job
+        result = await image_model.create(
+            current_user,
+            s3_key,
+            workload,
+            image.content_hash,
+            image.perceptual_hash,
         )
-
-        # Background task to process image
-        background_tasks.add_task(
-            background_processing, str(result["id"]), s3_key, workload, cloud_key
+        results.append(
+            ImageUploadResponse(
+                image_id=result["id"],
+                status=result["status"],
+                original_bytes=image.original_bytes,
+                stored_bytes=len(image.data),
+                bytes_saved=image.original_bytes - len(image.data),
+            )
         )
 
     return results
@@ -171,8 +115,53 @@ async def get_image_list(
     current_user: str = Depends(get_current_user),
     cursor: str = None,
     limit: int = Query(10, ge=1, le=100),
+    include_result: bool = True,
 ):
     image_model = Image()
-    images, next_cursor = image_model.get_by_user(current_user, cursor, limit)
+    images, next_cursor = await image_model.get_by_user(
+        current_user, cursor, limit, include_result
+    )
+
+    # Rows are already in response shape, skip model validation and re-encoding
+    return ORJSONResponse({"images": images, "next_cursor": next_cursor})
+
 
-    return PaginatedImageResponse(images=images, next_cursor=next_cursor)
+@process_router.post("/images/status")
+async def get_image_statuses(
+    params: ImageStatusBatchParams,
+    current_user: str = Depends(get_current_user),
+):
+    """Current state and result of some of the user's images; unknown ids are left out."""
+    if len(params.image_ids) > MAX_STATUS_BATCH:
+        raise HTTPException(
+            status_code=400, detail=f"Maximum {MAX_STATUS_BATCH} images allowed."
+        )
+    images = await Image().get_by_ids(params.image_ids, current_user)
+    return ORJSONResponse({"images": images})
+
+
+@process_router.get("/images/events")
+async def image_events(current_user: str = Depends(get_stream_user)):
+    """
+    Server-Sent Events with the status changes of the user's images:
+    `status` events carry image_id, status and served_by, a `resync` event
+    means some were missed and the list should be reloaded.
+    """
+    # X-Accel-Buffering keeps nginx from holding events back
+    return StreamingResponse(
+        sse_stream(current_user),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@process_router.websocket("/images/ws")
+async def image_events_ws(websocket: WebSocket, token: str):
+    """The events of /images/events as JSON messages over a WebSocket."""
+    payload = verify_token(token)
+    if payload is None or "sub" not in payload:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    await websocket_stream(websocket, payload["sub"])
@@ -1,7 +1,6 @@
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from ..models.token import create_token
+from ..models.token import create_token, revoke_token
 from ..models.connector import connector
 from ..token.schemas import TokenResponse, TokenCreateRequest
 from ..auth.security import get_current_user
@@ -14,7 +13,15 @@ async def create_token_endpoint(
     request: TokenCreateRequest, user_id: str = Depends(get_current_user)
 ):
     try:
-        result = create_token(connector, user_id, request.days_valid)
+        result = await create_token(connector, user_id, request.days_valid)
         return TokenResponse(token=result["token"], expires_at=result["expires_at"])
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+
+
+@token_router.delete("/token/{token}")
+async def revoke_token_endpoint(token: str, user_id: str = Depends(get_current_user)):
+    # Deleting the row notifies readonly_backend to drop the token from its cache
+    if not await revoke_token(connector, user_id, token):
+        raise HTTPException(status_code=404, detail="Token not found")
+    return {"status": "success", "message": "Token revoked"}
@@ -20,8 +20,8 @@ class CloudKeyResponse(BaseModel):
 async def update_cloud_key(
     key_update: CloudKeyUpdate, current_user: str = Depends(get_current_user)
 ):
-    with connector.engine.begin() as conn:
-        result = user.update_cloud_key(conn, current_user, key_update.cloud_key)
+    async with connector.engine.begin() as conn:
+        result = await user.update_cloud_key(conn, current_user, key_update.cloud_key)
         if not result:
             raise HTTPException(status_code=404, detail="User not found")
         return CloudKeyResponse(id=result.id, cloud_key=result.cloud_key)
@@ -29,8 +29,8 @@ async def update_cloud_key(
 
 @user_router.get("/user/cloud-key", response_model=CloudKeyResponse)
 async def get_cloud_key(current_user: str = Depends(get_current_user)):
-    with connector.engine.begin() as conn:
-        result = user.get_cloud_key(conn, current_user)
+    async with connector.engine.begin() as conn:
+        result = await user.get_cloud_key(conn, current_user)
         if not result:
             raise HTTPException(status_code=404, detail="User not found")
         return CloudKeyResponse(id=result.id, cloud_key=result.cloud_key)
@@ -0,0 +1,150 @@
+import asyncio
+import json
+import os
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, Iterator, Set
+
+import asyncpg
+from fastapi import WebSocket, WebSocketDisconnect
+
+from . import metrics
+
+# Events kept for a subscriber that reads too slowly; beyond that it gets a resync
+STATUS_EVENTS_QUEUE_SIZE = int(os.environ.get("STATUS_EVENTS_QUEUE_SIZE", 100))
+# Idle subscribers get a keepalive this often, which also detects gone clients
+STATUS_EVENTS_KEEPALIVE = float(os.environ.get("STATUS_EVENTS_KEEPALIVE", 15))
+STATUS_CHANNEL = "image_status"
+STATUS_LISTENER_RETRY_DELAY = 5
+# Tells a client it may have missed events and should reload its images
+RESYNC = {"event": "resync"}
+
+
+def sse_message(event: dict) -> str:
+    return f"event: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+class StatusEvents:
+    """
+    Image status changes, received over a single LISTEN connection per process
+    and fanned out to the SSE and WebSocket subscribers of the image's owner.
+    """
+
+    def __init__(self):
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self._counters = {"received": 0, "delivered": 0, "resyncs": 0}
+
+    @contextmanager
+    def subscribe(self, user_id: str) -> Iterator[asyncio.Queue]:
+        """Queue of the user's events (dicts) for as long as the block runs."""
+        queue = asyncio.Queue(STATUS_EVENTS_QUEUE_SIZE)
+        self._subscribers.setdefault(str(user_id), set()).add(queue)
+        try:
+            yield queue
+        finally:
+            queues = self._subscribers.get(str(user_id))
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[str(user_id)]
+
+    def _deliver(self, queue: asyncio.Queue, event: dict):
+        try:
+            queue.put_nowait(event)
+            self._counters["delivered"] += 1
+        except asyncio.QueueFull:
+            # A client this far behind reloads its list instead of catching up
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(RESYNC)
+            self._counters["resyncs"] += 1
+
+    def publish(self, user_id: str, event: dict):
+        for queue in self._subscribers.get(str(user_id), ()):
+            self._deliver(queue, event)
+
+    def resync_all(self):
+        for queues in self._subscribers.values():
+            for queue in queues:
+                self._deliver(queue, RESYNC)
+
+    async def listen(self, dsn: str):
+        """
+        Publish status NOTIFYs as they arrive, reconnecting forever.
+        Notifications may be lost while disconnected, so every subscriber is
+        told to resync whenever the listening connection is re-established.
+        """
+
+        def on_notify(connection, pid, channel, payload):
+            self._counters["received"] += 1
+            change = json.loads(payload)
+            self.publish(change.pop("user_id"), {"event": "status", **change})
+
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(STATUS_CHANNEL, on_notify)
+                self.resync_all()
+                await closed.wait()
+                print("Image status listener disconnected")
+            except asyncio.CancelledError:
+                if connection is not None:
+                    await connection.close()
+                raise
+            except Exception as e:
+                print(f"Image status listener failed: {e}")
+            await asyncio.sleep(STATUS_LISTENER_RETRY_DELAY)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self._subscribers),
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+            **self._counters,
+        }
+
+
+async def sse_stream(user_id: str) -> AsyncIterator[str]:
+    """The user's events as Server-Sent Events, with keepalive comments."""
+    with status_events.subscribe(user_id) as queue:
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), STATUS_EVENTS_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield sse_message(event)
+
+
+async def _wait_disconnect(websocket: WebSocket):
+    # Clients are not expected to send anything, receiving only notices them leaving
+    while (await websocket.receive())["type"] != "websocket.disconnect":
+        pass
+
+
+async def websocket_stream(websocket: WebSocket, user_id: str):
+    """Send the user's events as JSON messages until the client disconnects."""
+    with status_events.subscribe(user_id) as queue:
+        disconnected = asyncio.create_task(_wait_disconnect(websocket))
+        try:
+            while not disconnected.done():
+                getter = asyncio.create_task(queue.get())
+                await asyncio.wait(
+                    {getter, disconnected},
+                    timeout=STATUS_EVENTS_KEEPALIVE,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if getter.done():
+                    await websocket.send_json(getter.result())
+                else:
+                    getter.cancel()
+                    if not disconnected.done():
+                        await websocket.send_json({"event": "keepalive"})
+        except WebSocketDisconnect:
+            pass
+        finally:
+            disconnected.cancel()
+
+
+status_events = StatusEvents()
+metrics.register_collector("status_events", status_events.stats)
@@ -0,0 +1,180 @@
+import asyncio
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterable, Optional, Tuple
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+
+from . import metrics
+from .bucket_init import s3, public_s3, bucket_name, create_bucket, S3_MAX_WORKERS
+
+S3_MULTIPART_THRESHOLD = int(os.environ.get("S3_MULTIPART_THRESHOLD", 8 * 1024 * 1024))
+S3_MULTIPART_CONCURRENCY = int(os.environ.get("S3_MULTIPART_CONCURRENCY", 4))
+S3_STREAM_CHUNK_SIZE = int(os.environ.get("S3_STREAM_CHUNK_SIZE", 64 * 1024))
+S3_PRESIGN_EXPIRES = int(os.environ.get("S3_PRESIGN_EXPIRES", 300))
+S3_BUCKET_RETRY_DELAY = float(os.environ.get("S3_BUCKET_RETRY_DELAY", 5))
+
+
+def rendition_key(s3_key: str, rendition: str) -> str:
+    """Deterministic key of a rendition, stored next to its original."""
+    return f"{s3_key.rsplit('/', 1)[0]}/renditions/{rendition}.webp"
+
+
+class ObjectStorage:
+    """
+    Async facade over the boto3 S3 client.
+
+    boto3 is blocking, so every call runs in a bounded thread pool and the
+    event loop only awaits the result. Large uploads are split into
+    multipart chunks that boto3 sends concurrently.
+    """
+
+    def __init__(
+        self, client, bucket: str, presign_client=None, max_workers: int = S3_MAX_WORKERS
+    ):
+        self.client = client
+        self.presign_client = presign_client or client
+        self.bucket = bucket
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="s3"
+        )
+        self._transfer_config = TransferConfig(
+            multipart_threshold=S3_MULTIPART_THRESHOLD,
+            max_concurrency=S3_MULTIPART_CONCURRENCY,
+            use_threads=True,
+        )
+        self._latency = {
+            "upload": metrics.LatencyStats(),
+            "download": metrics.LatencyStats(),
+            "get_object": metrics.LatencyStats(),
+        }
+
+    async def _run(self, operation: str, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        with self._latency[operation].time():
+            return await loop.run_in_executor(
+                self._executor, lambda: func(*args, **kwargs)
+            )
+
+    async def ensure_bucket(self):
+        """
+        Create the bucket, retrying for as long as S3 is unreachable. Meant to
+        run as a startup task, so the process comes up even while S3 is down.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(
+                    self._executor, create_bucket, self.client, self.bucket
+                )
+                return
+            except Exception as e:
+                print(
+                    f"❌ Failed to initialize bucket, retrying in {S3_BUCKET_RETRY_DELAY:g} s: {e}"
+                )
+                await asyncio.sleep(S3_BUCKET_RETRY_DELAY)
+
+    async def upload(self, key: str, data: bytes, content_type: Optional[str] = None):
+        extra_args = {"ContentType": content_type} if content_type else None
+        await self._run(
+            "upload",
+            self.client.upload_fileobj,
+            io.BytesIO(data),
+            self.bucket,
+            key,
+            ExtraArgs=extra_args,
+            Config=self._transfer_config,
+        )
+
+    async def upload_many(self, items: Iterable[Tuple[str, bytes, Optional[str]]]):
+        """Upload several (key, data, content_type) objects concurrently."""
+        await asyncio.gather(
+            *(self.upload(key, data, content_type) for key, data, content_type in items)
+        )
+
+    async def download_file(self, key: str, path: str):
+        await self._run(
+            "download",
+            self.client.download_file,
+            self.bucket,
+            key,
+            path,
+            Config=self._transfer_config,
+        )
+
+    async def get_object(self, key: str) -> Tuple[bytes, str]:
+        """Return the object body and its content type."""
+
+        def _get():
+            response = self.client.get_object(Bucket=self.bucket, Key=key)
+            return response["Body"].read(), response["ContentType"]
+
+        return await self._run("get_object", _get)
+
+    async def open_object(self, key: str, **conditions) -> dict:
+        """
+        Start a GET without reading the body, for streaming with iter_body().
+        Conditions such as Range, IfNoneMatch or IfModifiedSince are passed
+        to S3 when set; unmet ones raise ClientError (304, 412, 416).
+        """
+        params = {name: value for name, value in conditions.items() if value}
+        return await self._run(
+            "get_object",
+            self.client.get_object,
+            Bucket=self.bucket,
+            Key=key,
+            **params,
+        )
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await self._run("get_object", self.client.head_object, Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response["ResponseMetadata"]["HTTPStatusCode"] == 404:
+                return False
+            raise
+        return True
+
+    async def iter_body(
+        self, body, chunk_size: int = S3_STREAM_CHUNK_SIZE
+    ) -> AsyncIterator[bytes]:
+        """Yield an S3 body chunk by chunk, reading each chunk in the pool."""
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self._executor, body.read, chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            body.close()
+
+    def presign_get(
+        self,
+        key: str,
+        filename: Optional[str] = None,
+        expires_in: int = S3_PRESIGN_EXPIRES,
+    ) -> str:
+        """
+        Short-lived GET URL for the object, so clients fetch it from S3 directly.
+        Signing is local computation, no request is sent.
+        """
+        params = {"Bucket": self.bucket, "Key": key}
+        if filename:
+            params["ResponseContentDisposition"] = f'attachment; filename="{filename}"'
+        return self.presign_client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=expires_in
+        )
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self._executor._max_workers,
+            "queued": self._executor._work_queue.qsize(),
+            **{name: stats.stats() for name, stats in self._latency.items()},
+        }
+
+
+storage = ObjectStorage(s3, bucket_name, presign_client=public_s3)
+metrics.register_collector("object_storage", storage.stats)
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+import signal
+
+from aiomisc.log import basic_config
+
+from .process.worker import ExtractionWorker
+from .process.http_clients import http_clients
+from .process.image_processor import token_manager
+from .models.connector import connector
+from .storage import storage
+
+
+async def main():
+    worker = ExtractionWorker()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    bucket_setup = asyncio.create_task(storage.ensure_bucket())
+    try:
+        await worker.run()
+    finally:
+        bucket_setup.cancel()
+        await asyncio.gather(bucket_setup, return_exceptions=True)
+        await token_manager.close()
+        await http_clients.close()
+        await connector.close()
+
+
+if __name__ == "__main__":
+    basic_config(logging.DEBUG, buffered=True)
+    asyncio.run(main())
@@ -0,0 +1,19 @@
+CREATE TABLE IF NOT EXISTS app.jobs (
+    id TEXT PRIMARY KEY DEFAULT gen_random_uuid(),
+    image_id TEXT NOT NULL REFERENCES app.images (id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL,
+    s3_key TEXT NOT NULL,
+    workload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    visible_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    locked_by TEXT,
+    last_error TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS jobs_claimable_idx
+ON app.jobs (visible_at)
+WHERE status IN ('queued', 'running');
@@ -0,0 +1,10 @@
+CREATE OR REPLACE FUNCTION app.notify_token_revoked() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('token_revoked', OLD.token);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER tokens_revoke_notify
+AFTER DELETE OR UPDATE OF token, user_id, expires_at ON app.tokens
+FOR EACH ROW EXECUTE FUNCTION app.notify_token_revoked();
@@ -0,0 +1,16 @@
+ALTER TABLE app.images
+ADD content_hash TEXT DEFAULT NULL,
+ADD perceptual_hash TEXT DEFAULT NULL;
+
+CREATE TABLE IF NOT EXISTS app.extraction_cache (
+    content_hash TEXT NOT NULL,
+    perceptual_hash TEXT NOT NULL,
+    workload TEXT NOT NULL,
+    prompt_version TEXT NOT NULL,
+    result_json JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (content_hash, workload, prompt_version)
+);
+
+CREATE INDEX IF NOT EXISTS extraction_cache_perceptual_idx
+ON app.extraction_cache (perceptual_hash, workload, prompt_version);
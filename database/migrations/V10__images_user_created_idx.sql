@@ -0,0 +1,2 @@
+CREATE INDEX IF NOT EXISTS images_user_created_idx
+ON app.images (user_id, created_at DESC, id DESC);
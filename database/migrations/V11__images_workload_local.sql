@@ -0,0 +1,3 @@
+ALTER TABLE app.images
+DROP CONSTRAINT images_workload_check,
+ADD CONSTRAINT images_workload_check CHECK (workload IN ('on_premise', 'cloud', 'local'));
@@ -0,0 +1,3 @@
+-- Provider that produced result_json: cloud, on_premise, local, or cache for reused results
+ALTER TABLE app.images
+ADD served_by TEXT;
@@ -0,0 +1,8 @@
+CREATE TABLE IF NOT EXISTS app.service_tokens (
+    name TEXT PRIMARY KEY,
+    access_token TEXT NOT NULL,
+    refresh_token TEXT DEFAULT NULL,
+    expires_at TIMESTAMP NOT NULL,
+    refresh_expires_at TIMESTAMP DEFAULT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
@@ -0,0 +1,20 @@
+CREATE OR REPLACE FUNCTION app.notify_image_status() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify(
+        'image_status',
+        json_build_object(
+            'image_id', NEW.id,
+            'user_id', NEW.user_id,
+            'status', NEW.status,
+            'served_by', NEW.served_by
+        )::text
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER images_status_notify
+AFTER UPDATE OF status ON app.images
+FOR EACH ROW
+WHEN (OLD.status IS DISTINCT FROM NEW.status)
+EXECUTE FUNCTION app.notify_image_status();
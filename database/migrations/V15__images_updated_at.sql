@@ -0,0 +1,5 @@
+ALTER TABLE app.images
+ADD updated_at TIMESTAMP NOT NULL DEFAULT NOW();
+
+UPDATE app.images
+SET updated_at = COALESCE(created_at, updated_at);
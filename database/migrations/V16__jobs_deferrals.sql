@@ -0,0 +1,2 @@
+ALTER TABLE app.jobs
+ADD deferrals INTEGER NOT NULL DEFAULT 0;
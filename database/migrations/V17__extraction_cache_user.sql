@@ -0,0 +1,7 @@
+ALTER TABLE app.extraction_cache
+ADD user_id TEXT DEFAULT NULL;
+
+-- Perceptual matches are only reused within the same user
+DROP INDEX IF EXISTS app.extraction_cache_perceptual_idx;
+CREATE INDEX IF NOT EXISTS extraction_cache_perceptual_idx
+ON app.extraction_cache (user_id, perceptual_hash, workload, prompt_version);
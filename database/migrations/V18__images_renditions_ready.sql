@@ -0,0 +1,2 @@
+ALTER TABLE app.images
+ADD renditions_ready BOOLEAN NOT NULL DEFAULT FALSE;
@@ -95,6 +95,48 @@ export default function FloatingDocButton() {
 
                 <p><strong>Response:</strong> same <code>ImageStatus</code> object as in the list.</p>
               </section>
+
+              <section>
+                <h3 className="font-semibold">🗂 Endpoint: <code>/api/images</code></h3>
+                <p>Statuses of many images at once, instead of one <code>/api/image</code> call each.</p>
+                <p><strong>Method:</strong> <code>POST</code></p>
+                <p><strong>Request Headers:</strong></p>
+                <pre><code>Authorization: Bearer &lt;your_token&gt;</code></pre>
+                <p><strong>Request Body (JSON):</strong></p>
+                <pre><code>{`{
+  "image_ids": ["abc123", "def456"], // up to 500
+  "updated_since": "2025-05-05T12:00:00Z", // optional
+  "include_result": false               // optional
+}`}</code></pre>
+                <p>
+                  Returns <code>{`{"images": [...]}`}</code> with <code>status</code>,{" "}
+                  <code>served_by</code> and <code>updated_at</code> of each image. Unknown ids,
+                  images of other users and, with <code>updated_since</code>, images unchanged
+                  since then are left out. Pass the latest <code>updated_at</code> you have
+                  seen as <code>updated_since</code> to only get changes.
+                </p>
+              </section>
+
+              <section>
+                <h3 className="font-semibold">📡 Endpoint: <code>{`/api/events?token={your_token}`}</code></h3>
+                <p>
+                  Server-Sent Events with the status changes of your images, instead of
+                  polling <code>/api/list</code>. The token may also be sent in the
+                  <code>Authorization</code> header.
+                </p>
+                <p><strong>Method:</strong> <code>GET</code></p>
+                <p><strong>Events:</strong></p>
+                <pre><code>{`event: status
+data: {"event": "status", "image_id": "abc123", "status": "finished", "served_by": "cloud"}
+
+event: resync
+data: {"event": "resync"}`}</code></pre>
+                <p>
+                  On <code>resync</code> some changes were missed, reload the list.
+                  The same messages are sent as JSON over the WebSocket{" "}
+                  <code>{`/api/ws?token={your_token}`}</code>.
+                </p>
+              </section>
             </div>
           </>
         </DialogContent>
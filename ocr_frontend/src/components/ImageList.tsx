@@ -39,7 +39,7 @@ const ImageList: React.FC = () => {
   const [isLoading, setIsLoading] = useState(false)
   const [error, setError] = useState<string | null>(null)
   const [selectedImage, setSelectedImage] = useState<Image | null>(null)
-  const { fetchWithAuth, apiBaseUrl } = useAuth()
+  const { fetchWithAuth, apiBaseUrl, accessToken } = useAuth()
   const observer = useRef<IntersectionObserver | null>(null)
   const lastImageElementRef = useCallback((node: HTMLDivElement | null) => {
     if (isLoading) return
@@ -145,6 +145,61 @@ const ImageList: React.FC = () => {
     }
   }, [])
 
+  // The stream handlers below outlive renders, they read the list from here
+  const imagesRef = useRef<Image[]>([])
+  imagesRef.current = images
+
+  // Reload only the given images and merge them into the list, keeping loaded pages
+  const refreshImages = async (imageIds: string[]) => {
+    for (let start = 0; start < imageIds.length; start += 100) {
+      const response = await fetchWithAuth("/images/status", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ image_ids: imageIds.slice(start, start + 100) }),
+      })
+      if (!response.ok) {
+        console.error("Failed to refresh images:", response.status)
+        return
+      }
+      const data: { images: Image[] } = await response.json()
+      const updated = new Map(data.images.map(image => [image.image_id, image]))
+      setImages(prev =>
+        prev.map(image => {
+          const fresh = updated.get(image.image_id)
+          return fresh ? { ...image, status: fresh.status, result_json: fresh.result_json } : image
+        })
+      )
+    }
+  }
+
+  // Status changes are pushed by the server instead of polling the list
+  useEffect(() => {
+    if (!accessToken) return
+
+    const source = new EventSource(
+      `${apiBaseUrl}/images/events?token=${encodeURIComponent(accessToken)}`
+    )
+    source.addEventListener("status", (event) => {
+      const change = JSON.parse((event as MessageEvent).data)
+      setImages(prev =>
+        prev.map(image =>
+          image.image_id === change.image_id ? { ...image, status: change.status } : image
+        )
+      )
+      // Results are not part of the event, fetch just this image to show them
+      if (change.status === "finished" || change.status === "error") {
+        refreshImages([change.image_id])
+      }
+    })
+    // Some events were missed, re-read the images that are loaded
+    source.addEventListener("resync", () => {
+      refreshImages(imagesRef.current.map(image => image.image_id))
+    })
+
+    // The token is only checked when the stream opens; it is reopened with every refreshed token
+    return () => source.close()
+  }, [accessToken, apiBaseUrl])
+
   if (error) {
     return (
       <div className="w-[65%] mx-auto p-4 bg-red-50 text-red-700 rounded-md">
@@ -1,7 +1,7 @@
 "use client"
 
 import type React from "react"
-import { useState, useRef } from "react"
+import { useState, useRef, useEffect } from "react"
 import { useAuth } from "../contexts/AuthContext"
 
 interface UploadResponse {
@@ -12,10 +12,27 @@ interface UploadResponse {
 const ImageUploader: React.FC = () => {
   const [isUploading, setIsUploading] = useState(false)
   const [uploadStatus, setUploadStatus] = useState<string | null>(null)
-  const [workload, setWorkload] = useState<"on_premise" | "cloud">("cloud")
+  const [workload, setWorkload] = useState<"on_premise" | "cloud" | "local">("cloud")
+  const [workloads, setWorkloads] = useState<string[]>(["cloud"])
   const fileInputRef = useRef<HTMLInputElement>(null)
   const { fetchWithAuth } = useAuth()
 
+  // Only offer the workloads this server has enabled, "local" needs its own inference service
+  useEffect(() => {
+    const fetchWorkloads = async () => {
+      try {
+        const response = await fetchWithAuth("/workloads")
+        if (response.ok) {
+          const data: { workloads: string[] } = await response.json()
+          setWorkloads(data.workloads)
+        }
+      } catch (error) {
+        console.error("Failed to fetch workloads:", error)
+      }
+    }
+    fetchWorkloads()
+  }, [])
+
   const handleUpload = async (e: React.FormEvent) => {
     e.preventDefault()
 
@@ -90,11 +107,12 @@ const ImageUploader: React.FC = () => {
           <label className="text-sm font-medium text-gray-700">Processing:</label>
           <select
             value={workload}
-            onChange={(e) => setWorkload(e.target.value as "on_premise" | "cloud")}
+            onChange={(e) => setWorkload(e.target.value as "on_premise" | "cloud" | "local")}
             className="border border-gray-300 rounded px-3 py-1 text-sm"
           >
             <option value="cloud">Cloud</option>
-            <option value="on_premise">On Premise</option>
+            {workloads.includes("on_premise") && <option value="on_premise">On Premise</option>}
+            {workloads.includes("local") && <option value="local">Local</option>}
           </select>
         </div>
 
@@ -0,0 +1,73 @@
+"""
+Latency benchmark of the inference profile configured through the environment.
+
+Renders synthetic receipts and times generate_batch on them directly, e.g.
+
+    CPU_QUANTIZE=false python benchmark.py
+    CPU_QUANTIZE=true TORCH_THREADS=8 MAX_PIXELS=401408 python benchmark.py --batch-sizes 1 4
+"""
+import argparse
+import random
+import statistics
+import time
+
+from PIL import Image, ImageDraw
+
+import server
+
+PROMPT = "Extract data from the receipt image and return it in JSON format."
+ITEMS = ["Milk 1L", "Bread", "Eggs x10", "Coffee beans", "Apples 1.2 kg", "Butter", "Cheese", "Water 6x1.5L"]
+
+
+def synthetic_receipt(seed: int) -> Image.Image:
+    """A receipt-like image: store header, item lines with prices, total."""
+    rng = random.Random(seed)
+    lines = [f"STORE #{rng.randint(100, 999)}", "12 Market Street", f"Receipt {rng.randint(10000, 99999)}", ""]
+    total = 0.0
+    for name in rng.sample(ITEMS, rng.randint(4, len(ITEMS))):
+        price = round(rng.uniform(0.5, 20), 2)
+        total += price
+        lines.append(f"{name:<20}{price:>8.2f}")
+    lines += ["", f"{'TOTAL':<20}{total:>8.2f}", "2024-05-01 12:34"]
+
+    img = Image.new("RGB", (600, 40 + 30 * len(lines)), "white")
+    draw = ImageDraw.Draw(img)
+    for i, line in enumerate(lines):
+        draw.text((30, 20 + 30 * i), line, fill="black")
+    return img
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5, help="timed runs per batch size")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, server.BATCH_MAX_SIZE])
+    args = parser.parse_args()
+
+    print(
+        f"model={server.MODEL_ID} device={server.DEVICE} "
+        f"quantized={server.DEVICE == 'cpu' and server.CPU_QUANTIZE} "
+        f"threads={server.torch.get_num_threads()} max_new_tokens={server.MAX_NEW_TOKENS} "
+        f"pixels={server.MIN_PIXELS}..{server.MAX_PIXELS}"
+    )
+
+    started = time.perf_counter()
+    server.generate_batch([PROMPT], [synthetic_receipt(0)])
+    print(f"first call (cold): {time.perf_counter() - started:.2f} s")
+
+    for batch_size in args.batch_sizes:
+        timings = []
+        for run in range(args.runs):
+            images = [synthetic_receipt(run * batch_size + i + 1) for i in range(batch_size)]
+            started = time.perf_counter()
+            server.generate_batch([PROMPT] * batch_size, images)
+            timings.append(time.perf_counter() - started)
+        median = statistics.median(timings)
+        print(
+            f"batch {batch_size}: median {median:.2f} s per batch, "
+            f"{median / batch_size:.2f} s per receipt, "
+            f"{batch_size / median:.2f} receipts/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Stand-in for server.py with no model: answers /v1/chat/completions with a
+receipt derived from the image hash after a configurable delay, so the
+upload -> extraction pipeline can be load-tested offline and reproducibly.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+# Every response takes FAKE_LATENCY_MS plus up to FAKE_JITTER_MS picked by the image hash
+FAKE_LATENCY_MS = float(os.environ.get("FAKE_LATENCY_MS", 500))
+FAKE_JITTER_MS = float(os.environ.get("FAKE_JITTER_MS", 0))
+# Requests served at once like a real model would, 0 for no limit; the rest wait
+FAKE_CONCURRENCY = int(os.environ.get("FAKE_CONCURRENCY", 0))
+# Delay between streamed chunks
+FAKE_CHUNK_DELAY_MS = float(os.environ.get("FAKE_CHUNK_DELAY_MS", 10))
+
+MODEL_ID = "fake-qwen"
+ITEMS = ["Milk", "Bread", "Eggs", "Coffee", "Apples", "Butter", "Cheese", "Water"]
+
+app = FastAPI()
+slots = asyncio.Semaphore(FAKE_CONCURRENCY) if FAKE_CONCURRENCY > 0 else None
+stats = {"requests": 0, "in_flight": 0}
+
+
+class ChatCompletionRequest(BaseModel):
+    model: Optional[str] = None
+    messages: List[Dict[str, Any]]
+    max_tokens: Optional[int] = None
+    stream: bool = False
+
+
+def image_digest(messages: List[Dict[str, Any]]) -> bytes:
+    """Hash of all image data in the request, or of the text if there is none."""
+    digest = hashlib.sha256()
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            digest.update(content.encode("utf-8"))
+            continue
+        for part in content or []:
+            if part.get("type") == "image_url":
+                url = part["image_url"]["url"] if isinstance(part["image_url"], dict) else part["image_url"]
+                digest.update(base64.b64decode(url.split(";base64,", 1)[-1]))
+    return digest.digest()
+
+
+def fake_receipt(digest: bytes) -> dict:
+    rng = random.Random(digest)
+    items = [
+        {
+            "name": name,
+            "quantity": {"amount": rng.randint(1, 5), "unit_of_measurement": "pcs"},
+            "price": round(rng.uniform(0.5, 20), 2),
+            "discount": 0,
+        }
+        for name in rng.sample(ITEMS, rng.randint(1, 5))
+    ]
+    return {
+        "receipt_number": f"{rng.randint(10000, 99999)}",
+        "store_name": f"Store {digest.hex()[:6]}",
+        "store_address": "12 Market Street",
+        "date_time": "2024-05-01 12:34",
+        "currency": "EUR",
+        "total_amount": round(sum(item["price"] * item["quantity"]["amount"] for item in items), 2),
+        "total_discount": 0,
+        "total_tax": 0,
+        "items": items,
+    }
+
+
+async def respond(digest: bytes) -> str:
+    delay = FAKE_LATENCY_MS + FAKE_JITTER_MS * random.Random(digest).random()
+    await asyncio.sleep(delay / 1000)
+    return json.dumps(fake_receipt(digest))
+
+
+def completion_chunk(completion_id: str, created: int, delta: dict, finish_reason: Optional[str] = None) -> str:
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": MODEL_ID,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: ChatCompletionRequest):
+    digest = image_digest(request.messages)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+    stats["requests"] += 1
+    stats["in_flight"] += 1
+    try:
+        if slots is not None:
+            async with slots:
+                content = await respond(digest)
+        else:
+            content = await respond(digest)
+    finally:
+        stats["in_flight"] -= 1
+
+    if request.stream:
+        async def events():
+            yield completion_chunk(completion_id, created, {"role": "assistant", "content": ""})
+            for start in range(0, len(content), 16):
+                await asyncio.sleep(FAKE_CHUNK_DELAY_MS / 1000)
+                yield completion_chunk(completion_id, created, {"content": content[start:start + 16]})
+            yield completion_chunk(completion_id, created, {}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": MODEL_ID,
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+        ],
+    }
+
+@app.get("/metrics")
+async def metrics():
+    return stats
@@ -1,18 +1,399 @@
-from fastapi import FastAPI, UploadFile
-from transformers import AutoProcessor, AutoModelForVision2Seq
-import torch
-from PIL import Image
+import asyncio
+import base64
+import binascii
 import io
+import json
+import os
+import time
+import uuid
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from fastapi import FastAPI, HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from transformers import AutoProcessor, AutoModelForVision2Seq, StoppingCriteria, StoppingCriteriaList, TextStreamer
+import torch
+from PIL import Image, UnidentifiedImageError
+
+# Any Qwen2-VL checkpoint; a tiny random one (e.g. hf-internal-testing/tiny-random-Qwen2VLForConditionalGeneration)
+# is enough to exercise the endpoints on CPU
+MODEL_ID = os.environ.get("MODEL_ID", "Qwen/Qwen2-VL-2B-Instruct")
+# A batch runs once it has BATCH_MAX_SIZE requests or BATCH_WINDOW_MS after its first one
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", 8))
+BATCH_WINDOW_MS = float(os.environ.get("BATCH_WINDOW_MS", 20))
+LATENCY_WINDOW = 1000
+
+DEVICE = os.environ.get("DEVICE", "cuda" if torch.cuda.is_available() else "cpu")
+# CPU profile: int8 dynamic quantization of the linear layers, fp32 activations
+CPU_QUANTIZE = os.environ.get("CPU_QUANTIZE", "true").lower() == "true"
+# 0 keeps the torch default of one thread per physical core
+TORCH_THREADS = int(os.environ.get("TORCH_THREADS", 0))
+MAX_NEW_TOKENS = int(os.environ.get("MAX_NEW_TOKENS", 512))
+# Bounds on the image area the processor resizes to; every 28x28 patch is one visual token
+MIN_PIXELS = int(os.environ.get("MIN_PIXELS", 256 * 28 * 28))
+MAX_PIXELS = int(os.environ.get("MAX_PIXELS", 768 * 28 * 28))
+WARMUP = os.environ.get("WARMUP", "true").lower() == "true"
+
+if TORCH_THREADS:
+    torch.set_num_threads(TORCH_THREADS)
+
+processor = AutoProcessor.from_pretrained(MODEL_ID, min_pixels=MIN_PIXELS, max_pixels=MAX_PIXELS)
+# Decoder-only generation needs the padding on the left of each prompt
+processor.tokenizer.padding_side = "left"
+model = AutoModelForVision2Seq.from_pretrained(MODEL_ID).to(DEVICE).eval()
+if DEVICE == "cpu" and CPU_QUANTIZE:
+    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class GenerationRequest(NamedTuple):
+    # chat messages in the processor's format, images in the order they appear
+    messages: List[dict]
+    images: List[Image.Image]
+    max_new_tokens: int
+    future: asyncio.Future
+    enqueued_at: float
+
+
+def image_prompt(prompt: str) -> List[dict]:
+    """Messages of a single user turn: one image followed by the prompt."""
+    return [{"role": "user", "content": [{"type": "image"}, {"type": "text", "text": prompt}]}]
+
+
+def _model_inputs(conversations: List[List[dict]], images: List[List[Image.Image]]):
+    texts = [
+        processor.apply_chat_template(messages, add_generation_prompt=True)
+        for messages in conversations
+    ]
+    flat_images = [image for row in images for image in row]
+    return processor(
+        text=texts, images=flat_images or None, padding=True, return_tensors="pt"
+    ).to(model.device)
+
+
+class RowTokenLimits(StoppingCriteria):
+    """Finishes each row of a batch once it has its own number of new tokens."""
+
+    def __init__(self, prompt_length: int, limits: List[int]):
+        self.prompt_length = prompt_length
+        self.limits = torch.tensor(limits)
+
+    def __call__(self, input_ids, scores, **kwargs) -> torch.BoolTensor:
+        return input_ids.shape[1] - self.prompt_length >= self.limits.to(input_ids.device)
+
+
+@torch.inference_mode()
+def generate_conversations(
+    conversations: List[List[dict]],
+    images: List[List[Image.Image]],
+    max_new_tokens: Union[int, List[int]] = MAX_NEW_TOKENS,
+) -> List[str]:
+    """
+    Run one padded generate call for all conversations and return the new text of each.
+    `max_new_tokens` is one limit for every row or a limit per row; a row that reaches
+    its own limit is finished while the others go on.
+    """
+    if isinstance(max_new_tokens, int):
+        max_new_tokens = [max_new_tokens] * len(conversations)
+    inputs = _model_inputs(conversations, images)
+    # The prompt tokens are the same length for every row after padding
+    prompt_length = inputs["input_ids"].shape[1]
+    generated_ids = model.generate(
+        **inputs,
+        max_new_tokens=max(max_new_tokens),
+        stopping_criteria=StoppingCriteriaList([RowTokenLimits(prompt_length, max_new_tokens)]),
+    )
+    return processor.batch_decode(
+        [
+            row[prompt_length:prompt_length + limit]
+            for row, limit in zip(generated_ids, max_new_tokens)
+        ],
+        skip_special_tokens=True,
+    )
+
+
+def generate_batch(prompts: List[str], images: List[Image.Image]) -> List[str]:
+    """One image and one prompt per row."""
+    return generate_conversations(
+        [image_prompt(prompt) for prompt in prompts], [[image] for image in images]
+    )
+
+
+class QueueStreamer(TextStreamer, StoppingCriteria):
+    """
+    Hands decoded text from the inference thread to an asyncio queue,
+    None marks the end. Also stops generation once the reader is gone.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue):
+        super().__init__(processor.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        self.loop = loop
+        self.queue = queue
+        self.cancelled = False
+
+    def on_finalized_text(self, text: str, stream_end: bool = False):
+        if text:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, text)
+        if stream_end:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, None)
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.cancelled
+
+
+@torch.inference_mode()
+def generate_stream(messages: List[dict], images: List[Image.Image], max_new_tokens: int, streamer: QueueStreamer):
+    inputs = _model_inputs([messages], [images])
+    model.generate(
+        **inputs, max_new_tokens=max_new_tokens, streamer=streamer, stopping_criteria=StoppingCriteriaList([streamer])
+    )
+
+
+class BatchScheduler:
+    """
+    Collects /generate requests into batches for a single inference thread.
+
+    The model runs one batch at a time in its own thread, so the event loop
+    keeps accepting requests while it works; those requests form the next batch.
+    """
 
-app = FastAPI()
+    def __init__(self, max_batch_size: int = BATCH_MAX_SIZE, window_ms: float = BATCH_WINDOW_MS):
+        self.max_batch_size = max_batch_size
+        self.window = window_ms / 1000
+        self._queue: asyncio.Queue = None
+        self._task = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._batch_sizes = Counter()
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._completed = 0
+        self._failed = 0
+
+    async def warm_up(self):
+        """
+        Run one tiny generation before serving, so kernel selection, thread
+        pools and allocator growth are not paid for by the first request.
+        """
+        started = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(
+            self._executor, generate_batch, ["Describe the image."], [Image.new("RGB", (448, 448), "white")]
+        )
+        print(f"Warm-up finished in {time.perf_counter() - started:.1f} s")
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    async def submit(
+        self, messages: List[dict], images: List[Image.Image], max_new_tokens: int = MAX_NEW_TOKENS
+    ) -> str:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(
+            GenerationRequest(messages, images, max_new_tokens, future, time.perf_counter())
+        )
+        return await future
+
+    async def stream(self, messages: List[dict], images: List[Image.Image], max_new_tokens: int = MAX_NEW_TOKENS):
+        """
+        Yield text pieces as they are generated. Streams run alone, one token
+        at a time, on the same inference thread as the batches.
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        streamer = QueueStreamer(loop, queue)
+        started = time.perf_counter()
+        task = loop.run_in_executor(self._executor, generate_stream, messages, images, max_new_tokens, streamer)
+        # Also ends the stream if generation fails before finishing it
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        self._batch_sizes[1] += 1
+        try:
+            while True:
+                text = await queue.get()
+                if text is None:
+                    break
+                yield text
+            await task
+            self._completed += 1
+            self._latencies.append(time.perf_counter() - started)
+        except Exception:
+            self._failed += 1
+            raise
+        finally:
+            streamer.cancelled = True
+
+    async def _collect(self) -> List[GenerationRequest]:
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Callers that gave up while queued do not take a batch slot
+            batch = [request for request in batch if not request.future.done()]
+            if not batch:
+                continue
+            self._batch_sizes[len(batch)] += 1
+            try:
+                results = await loop.run_in_executor(
+                    self._executor,
+                    generate_conversations,
+                    [request.messages for request in batch],
+                    [request.images for request in batch],
+                    [request.max_new_tokens for request in batch],
+                )
+            except Exception as e:
+                self._failed += len(batch)
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                continue
+
+            finished_at = time.perf_counter()
+            self._completed += len(batch)
+            for request, result in zip(batch, results):
+                self._latencies.append(finished_at - request.enqueued_at)
+                if not request.future.done():
+                    request.future.set_result(result)
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 1)
+
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_batch_size": self.max_batch_size,
+            "window_ms": self.window * 1000,
+            "batch_sizes": dict(sorted(self._batch_sizes.items())),
+            "completed": self._completed,
+            "failed": self._failed,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)},
+        }
+
+
+scheduler = BatchScheduler()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if WARMUP:
+        await scheduler.warm_up()
+    scheduler.start()
+    yield
+    await scheduler.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+class ChatCompletionRequest(BaseModel):
+    model: Optional[str] = None
+    messages: List[Dict[str, Any]]
+    max_tokens: Optional[int] = None
+    stream: bool = False
+
+
+def open_image(data: bytes) -> Image.Image:
+    try:
+        return Image.open(io.BytesIO(data)).convert("RGB")
+    except (UnidentifiedImageError, OSError):
+        # OSError: an image that is identified but truncated fails in convert()
+        raise HTTPException(status_code=400, detail="Image data is not a readable image")
+
+
+def decode_data_url(url: str) -> Image.Image:
+    if not url.startswith("data:") or ";base64," not in url:
+        raise HTTPException(status_code=400, detail="Only base64 data: image URLs are supported")
+    try:
+        data = base64.b64decode(url.split(";base64,", 1)[1], validate=True)
+    except binascii.Error:
+        raise HTTPException(status_code=400, detail="Image data is not valid base64")
+    return open_image(data)
+
+
+def convert_messages(messages: List[Dict[str, Any]]) -> Tuple[List[dict], List[Image.Image]]:
+    """OpenAI chat messages to the processor's format, with the decoded images."""
+    converted, images = [], []
+    for message in messages:
+        content: Union[str, List[dict]] = message.get("content") or ""
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        parts = []
+        for part in content:
+            if part.get("type") == "image_url":
+                url = part["image_url"]["url"] if isinstance(part["image_url"], dict) else part["image_url"]
+                images.append(decode_data_url(url))
+                parts.append({"type": "image"})
+            elif part.get("type") == "text":
+                parts.append({"type": "text", "text": part["text"]})
+        converted.append({"role": message["role"], "content": parts})
+    return converted, images
+
+
+def completion_chunk(completion_id: str, created: int, delta: dict, finish_reason: Optional[str] = None) -> str:
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": created,
+        "model": MODEL_ID,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
 
-processor = AutoProcessor.from_pretrained("Qwen/Qwen2-VL-2B-Instruct")
-model = AutoModelForVision2Seq.from_pretrained("Qwen/Qwen2-VL-2B-Instruct").to("cuda" if torch.cuda.is_available() else "cpu")
 
 @app.post("/generate")
 async def generate(file: UploadFile, prompt: str):
-    image = Image.open(io.BytesIO(await file.read())).convert("RGB")
-    inputs = processor(prompt=prompt, images=image, return_tensors="pt").to(model.device)
-    generated_ids = model.generate(**inputs)
-    result = processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
+    image = open_image(await file.read())
+    result = await scheduler.submit(image_prompt(prompt), [image])
     return {"response": result}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: ChatCompletionRequest):
+    messages, images = convert_messages(request.messages)
+    max_new_tokens = min(request.max_tokens or MAX_NEW_TOKENS, MAX_NEW_TOKENS)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    if request.stream:
+        async def events():
+            yield completion_chunk(completion_id, created, {"role": "assistant", "content": ""})
+            async for text in scheduler.stream(messages, images, max_new_tokens):
+                yield completion_chunk(completion_id, created, {"content": text})
+            yield completion_chunk(completion_id, created, {}, "stop")
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    result = await scheduler.submit(messages, images, max_new_tokens)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": MODEL_ID,
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": result}, "finish_reason": "stop"}
+        ],
+    }
+
+@app.get("/metrics")
+async def metrics():
+    return scheduler.stats()
@@ -1,14 +1,14 @@
 import os
 from datetime import datetime, timedelta, timezone
+from typing import Optional
 from jose import jwt, JWTError
 
 from fastapi import Request, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy import text
 
 from ..models.connector import connector
-
-from ..constants import BASE_POSTGRES_TRANSACTIONS_DIRECTORY
+from ..models.queries import queries
+from .token_cache import token_cache
 
 security_scheme = HTTPBearer(auto_error=False)
 
@@ -17,24 +17,30 @@ async def get_current_user(request: Request):
     if credentials is None or credentials.scheme.lower() != "bearer":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
 
-    token = credentials.credentials
-    user_id = get_user_id(connector, token)
+    return await get_token_user(credentials.credentials)
+
+async def get_stream_user(request: Request, token: Optional[str] = None):
+    """
+    get_current_user for event streams: browsers cannot set headers on
+    EventSource or WebSocket, so the token may come as a query parameter.
+    """
+    if token is None:
+        return await get_current_user(request)
+    return await get_token_user(token)
+
+async def get_token_user(token: str):
+    hit, user_id = token_cache.get(token)
+    if not hit:
+        generation = token_cache.generation
+        user_id, expires_at = await get_user_id(connector, token)
+        token_cache.put(token, user_id, expires_at, generation)
     if user_id is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
 
     return user_id  # return user id
 
-def get_user_id(connector, token: str):
-    with connector.engine.begin() as conn:     
-        with open(f"{BASE_POSTGRES_TRANSACTIONS_DIRECTORY}/get_user_id.sql") as f:
-            query = text(f.read())
-            result = conn.execute(
-                query,
-                {
-                    "token": token,
-                }
-            ).fetchone()
-
-            return result.user_id if result else None
-        
-    
+async def get_user_id(connector, token: str):
+    async with connector.engine.begin() as conn:
+        result = (await conn.execute(queries["get_user_id"], {"token": token})).fetchone()
+
+        return (result.user_id, result.expires_at) if result else (None, None)
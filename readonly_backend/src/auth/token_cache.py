@@ -0,0 +1,96 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+import asyncpg
+
+TOKEN_CACHE_MAX_SIZE = int(os.environ.get('TOKEN_CACHE_MAX_SIZE', 10000))
+TOKEN_CACHE_TTL = float(os.environ.get('TOKEN_CACHE_TTL', 300))
+TOKEN_CACHE_NEGATIVE_TTL = float(os.environ.get('TOKEN_CACHE_NEGATIVE_TTL', 10))
+TOKEN_REVOKE_CHANNEL = 'token_revoked'
+TOKEN_LISTENER_RETRY_DELAY = 5
+
+class TokenCache:
+    """
+    Bounded LRU of API token -> user id with a TTL.
+
+    Unknown tokens are cached as None for a shorter TTL, and entries never
+    outlive the token's own expires_at. Deleted or changed tokens are evicted
+    through Postgres NOTIFY on the token_revoked channel, see listen().
+
+    A lookup can race with a revocation: read `generation` before querying
+    the database and pass it to put(), which drops the result if anything was
+    invalidated meanwhile.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[str, Tuple[Optional[str], float]]' = OrderedDict()
+        self.generation = 0
+
+    def get(self, token: str) -> Tuple[bool, Optional[str]]:
+        """Returns (hit, user_id); user_id is None for a cached invalid token."""
+        entry = self._entries.get(token)
+        if entry is None:
+            return False, None
+        user_id, valid_until = entry
+        if time.monotonic() >= valid_until:
+            del self._entries[token]
+            return False, None
+        self._entries.move_to_end(token)
+        return True, user_id
+
+    def put(self, token: str, user_id: Optional[str], expires_at: Optional[datetime] = None, generation: Optional[int] = None):
+        if generation is not None and generation != self.generation:
+            return
+        ttl = TOKEN_CACHE_TTL if user_id is not None else TOKEN_CACHE_NEGATIVE_TTL
+        if expires_at is not None:
+            # expires_at is stored as a naive UTC timestamp
+            ttl = min(ttl, (expires_at - datetime.utcnow()).total_seconds())
+        if ttl <= 0:
+            return
+        self._entries[token] = (user_id, time.monotonic() + ttl)
+        self._entries.move_to_end(token)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, token: str):
+        self.generation += 1
+        self._entries.pop(token, None)
+
+    def clear(self):
+        self.generation += 1
+        self._entries.clear()
+
+    async def listen(self, dsn: str):
+        """
+        Evict revoked tokens as their NOTIFYs arrive, reconnecting forever.
+        Notifications may be lost while disconnected, so the cache is cleared
+        whenever the listening connection is (re)established.
+        """
+        def on_notify(connection, pid, channel, payload):
+            self.invalidate(payload)
+
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(TOKEN_REVOKE_CHANNEL, on_notify)
+                self.clear()
+                await closed.wait()
+                print('Token revocation listener disconnected')
+            except asyncio.CancelledError:
+                if connection is not None:
+                    await connection.close()
+                raise
+            except Exception as e:
+                print(f'Token revocation listener failed: {e}')
+            self.clear()
+            await asyncio.sleep(TOKEN_LISTENER_RETRY_DELAY)
+
+token_cache = TokenCache()
@@ -1,7 +1,42 @@
+import asyncio
+import logging
+import re
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, APIRouter
 from fastapi.middleware.cors import CORSMiddleware
 
 from .routers.read_router import read_router
+from .models.connector import connector
+from .auth.token_cache import token_cache
+from .status_events import status_events
+
+TOKEN_PARAM = re.compile(r"([?&]token=)[^&]*")
+
+
+class RedactAccessToken(logging.Filter):
+    """
+    The status streams take the access token as a query parameter, since
+    EventSource and WebSocket cannot send headers; keep it out of the access log.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # uvicorn.access args: client, method, path with query, HTTP version, status
+        if isinstance(record.args, tuple) and len(record.args) == 5:
+            args = list(record.args)
+            args[2] = TOKEN_PARAM.sub(r"\1[redacted]", str(args[2]))
+            record.args = tuple(args)
+        return True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    revoke_listener = asyncio.create_task(token_cache.listen(connector.dsn))
+    status_listener = asyncio.create_task(status_events.listen(connector.dsn))
+    yield
+    revoke_listener.cancel()
+    status_listener.cancel()
+    await asyncio.gather(revoke_listener, status_listener, return_exceptions=True)
+    await connector.close()
 
 app = FastAPI(title="Readonly Backend")
 router = APIRouter(prefix="/api")
@@ -10,7 +45,7 @@ router = APIRouter(prefix="/api")
 async def root():
     return {"message": "Readonly Backend API"}
 
-app = FastAPI(title="Readonly Backend")
+app = FastAPI(title="Readonly Backend", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -20,4 +55,5 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(read_router)
\ No newline at end of file
+app.include_router(read_router)
+logging.getLogger("uvicorn.access").addFilter(RedactAccessToken())
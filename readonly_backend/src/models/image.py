@@ -1,71 +1,113 @@
-from typing import Tuple, List
-from datetime import datetime
+from typing import Tuple, List, Optional
+from datetime import datetime, timezone
+import base64
+import json
 
-from sqlalchemy import text
-
-from ..models.schemas import ImageStatus
 from ..models.connector import connector
-from ..constants import BASE_POSTGRES_TRANSACTIONS_DIRECTORY
+from ..models.queries import queries
+
+def encode_cursor(created_at: datetime, image_id: str) -> str:
+        """Opaque keyset cursor pointing right after the (created_at, id) row."""
+        raw = json.dumps([created_at.isoformat(), image_id]).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
 
-def get_by_user(user_id: str, cursor: str = None, limit: int = 10) -> Tuple[List[ImageStatus], str]:
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], Optional[str]]:
+        """Returns (created_at, id) of the cursor row, or (None, None) for the first page."""
+        if not cursor:
+            return None, None
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            created_at, image_id = json.loads(raw)
+            return datetime.fromisoformat(created_at), str(image_id)
+        except (ValueError, TypeError):
+            pass
+        # Cursors issued before keyset pagination were a bare ISO timestamp
+        try:
+            return datetime.fromisoformat(cursor), ""
+        except ValueError:
+            return None, None
+
+async def get_by_user(user_id: str, cursor: str = None, limit: int = 10, include_result: bool = True) -> Tuple[List[dict], str]:
         """
-        Get paginated images for a specific user.
+        Get paginated images for a specific user, newest first.
+        Images are plain dicts carrying result_json as the raw JSON text from
+        Postgres, so they can be serialized without another parse/dump pass.
+        With include_result=False the result_json column is not read at all.
         Returns: (images, next_cursor)
         """
-        with connector.engine.begin() as conn:
-            # If cursor is provided, parse it as timestamp
-            cursor_timestamp = None
-            if cursor:
-                try:
-                    cursor_timestamp = datetime.fromisoformat(cursor)
-                except ValueError:
-                    cursor_timestamp = None
+        async with connector.engine.begin() as conn:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
 
-            select_sql = open(f"{BASE_POSTGRES_TRANSACTIONS_DIRECTORY}/images_get_by_user.sql").read()
-            query = text(select_sql)
-            
-            params = {"user_id": user_id, "limit": limit, "cursor_timestamp": cursor_timestamp}
+            params = {"user_id": user_id, "limit": limit, "cursor_created_at": cursor_created_at, "cursor_id": cursor_id}
             
-            results = conn.execute(query, params).fetchall()
+            query = queries["images_get_by_user" if include_result else "images_get_by_user_summary"]
+            results = (await conn.execute(query, params)).fetchall()
             
-            # Get the next cursor (timestamp of the last record)
+            # A short page is the last one
             next_cursor = None
-            if results:
-                next_cursor = results[-1].created_at.isoformat()
+            if len(results) == limit:
+                next_cursor = encode_cursor(results[-1].created_at, str(results[-1].id))
 
             images = [
-                ImageStatus(
-                    image_id=str(row.id),
-                    s3_key=str(row.s3_key),
-                    status=str(row.status),
-                    result_json=str(row.result_json),
-                    created_at=row.created_at
-                )
+                {
+                    "image_id": str(row.id),
+                    "s3_key": row.s3_key,
+                    "status": row.status,
+                    "result_json": row.result_json if include_result else None,
+                    "created_at": row.created_at
+                }
                 for row in results
             ]
             
             return images, next_cursor 
         
-def get_by_id(image_id: str) -> ImageStatus:
+async def get_by_id(image_id: str) -> Optional[dict]:
         """
         Get image by it's id.
-        Returns: ImageStatus
+        Returns: ImageStatus-shaped dict with raw result_json text
         """
-        with connector.engine.begin() as conn:
-            select_sql = open(f"{BASE_POSTGRES_TRANSACTIONS_DIRECTORY}/images_get_by_id.sql").read()
-            query = text(select_sql)
-            
+        async with connector.engine.begin() as conn:
             params = {"image_id": image_id}
             
-            result = conn.execute(query, params).fetchone()
+            result = (await conn.execute(queries["images_get_by_id"], params)).fetchone()
             
             if not result:
                 return None
                 
-            return ImageStatus(
-                image_id=str(result.id),
-                s3_key=str(result.s3_key), 
-                status=str(result.status),
-                result_json=str(result.result_json),
-                created_at=result.created_at
-            )
+            return {
+                "image_id": str(result.id),
+                "s3_key": result.s3_key,
+                "status": result.status,
+                "result_json": result.result_json,
+                "created_at": result.created_at
+            }
+
+async def get_by_ids(image_ids: List[str], user_id: str, updated_since: Optional[datetime] = None, include_result: bool = False) -> List[dict]:
+        """
+        Get the images of `user_id` among `image_ids` in a single query,
+        optionally only those updated after `updated_since`.
+        Ids that do not exist or belong to another user are left out.
+        """
+        # updated_at is a TIMESTAMP column holding UTC, asyncpg wants a naive value
+        if updated_since is not None and updated_since.tzinfo is not None:
+            updated_since = updated_since.astimezone(timezone.utc).replace(tzinfo=None)
+
+        async with connector.engine.begin() as conn:
+            params = {"image_ids": list(image_ids), "user_id": user_id, "updated_since": updated_since}
+
+            query = queries["images_get_by_ids" if include_result else "images_get_by_ids_summary"]
+            results = (await conn.execute(query, params)).fetchall()
+
+            return [
+                {
+                    "image_id": str(row.id),
+                    "s3_key": row.s3_key,
+                    "status": row.status,
+                    "status_reason": row.status_reason,
+                    "served_by": row.served_by,
+                    "result_json": row.result_json if include_result else None,
+                    "created_at": row.created_at,
+                    "updated_at": row.updated_at
+                }
+                for row in results
+            ]
@@ -1 +1 @@
-SELECT user_id FROM app.tokens WHERE token = :token AND (expires_at IS NULL OR expires_at >= NOW()) LIMIT 1;
\ No newline at end of file
+SELECT user_id, expires_at FROM app.tokens WHERE token = :token AND (expires_at IS NULL OR expires_at >= NOW()) LIMIT 1;
\ No newline at end of file
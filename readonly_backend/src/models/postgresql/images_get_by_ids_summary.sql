@@ -0,0 +1,5 @@
+SELECT id, s3_key, status, status_reason, served_by, created_at, updated_at
+FROM app.images
+WHERE id = ANY(CAST(:image_ids AS TEXT[]))
+  AND user_id = :user_id
+  AND (CAST(:updated_since AS TIMESTAMP) IS NULL OR updated_at > :updated_since);
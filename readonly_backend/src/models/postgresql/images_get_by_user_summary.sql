@@ -0,0 +1,9 @@
+SELECT id, s3_key, status, created_at
+FROM app.images
+WHERE user_id = :user_id
+  AND (
+    CAST(:cursor_created_at AS TIMESTAMP) IS NULL
+    OR (created_at, id) < (:cursor_created_at, :cursor_id)
+  )
+ORDER BY created_at DESC, id DESC
+LIMIT :limit;
@@ -0,0 +1,27 @@
+import os
+from typing import Dict
+
+from sqlalchemy import text
+from sqlalchemy.sql.elements import TextClause
+
+from ..constants import BASE_POSTGRES_TRANSACTIONS_DIRECTORY
+
+class QueryRegistry:
+    """
+    All .sql files of a directory, read once at startup and kept as compiled
+    `text()` clauses keyed by file name without extension.
+    """
+
+    def __init__(self, directory: str):
+        self._queries: Dict[str, TextClause] = {}
+        for filename in sorted(os.listdir(directory)):
+            name, extension = os.path.splitext(filename)
+            if extension != '.sql':
+                continue
+            with open(os.path.join(directory, filename)) as f:
+                self._queries[name] = text(f.read())
+
+    def __getitem__(self, name: str) -> TextClause:
+        return self._queries[name]
+
+queries = QueryRegistry(BASE_POSTGRES_TRANSACTIONS_DIRECTORY)
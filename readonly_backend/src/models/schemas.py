@@ -6,7 +6,7 @@ class ImageStatus(BaseModel):
     image_id: str
     s3_key: str
     status: str
-    result_json: str
+    result_json: Optional[str] = None
     created_at: datetime
 
 class PaginatedImageResponse(BaseModel):
@@ -16,3 +16,22 @@ class PaginatedImageResponse(BaseModel):
 class ImageListParams(BaseModel):
     cursor: Optional[str] = None
     limit: int = 10
+    include_result: bool = True
+
+class ImageBatchParams(BaseModel):
+    image_ids: List[str]
+    updated_since: Optional[datetime] = None
+    include_result: bool = False
+
+class ImageBatchStatus(BaseModel):
+    image_id: str
+    s3_key: str
+    status: str
+    status_reason: Optional[str] = None
+    served_by: Optional[str] = None
+    result_json: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+
+class ImageBatchResponse(BaseModel):
+    images: List[ImageBatchStatus]
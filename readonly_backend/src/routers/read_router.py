@@ -1,25 +1,77 @@
+import os
 from typing import Optional
 
-from fastapi import APIRouter, HTTPException, Query, status, Depends
+from fastapi import APIRouter, HTTPException, Query, status, Depends, WebSocket
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from ..models.connector import DBConnector
-from ..auth.security import get_current_user
-from ..models.schemas import PaginatedImageResponse, ImageListParams
-from ..models.image import get_by_user, get_by_id
+from ..auth.security import get_current_user, get_stream_user, get_token_user
+from ..status_events import sse_stream, websocket_stream
+from ..models.schemas import (
+    ImageStatus,
+    PaginatedImageResponse,
+    ImageListParams,
+    ImageBatchParams,
+    ImageBatchResponse,
+)
+from ..models.image import get_by_user, get_by_id, get_by_ids
 
 read_router = APIRouter(tags=["read"], prefix="/api")
 
+IMAGE_BATCH_MAX_SIZE = int(os.environ.get("IMAGE_BATCH_MAX_SIZE", 500))
+
 @read_router.post("/list", response_model=PaginatedImageResponse)
 async def list_images(
     params: ImageListParams,
     user_id: str =  Depends(get_current_user)):
-    images, next_cursor = get_by_user(user_id, params.cursor, params.limit)
+    images, next_cursor = await get_by_user(user_id, params.cursor, params.limit, params.include_result)
     
-    return PaginatedImageResponse(
-        images=images,
-        next_cursor=next_cursor
-    )
+    # Rows are already in response shape, skip model validation and re-encoding
+    return ORJSONResponse({
+        "images": images,
+        "next_cursor": next_cursor
+    })
 
-@read_router.get("/image")
+@read_router.get("/image", response_model=Optional[ImageStatus])
 async def get_image_data(image_id: str, _: str = Depends(get_current_user)):
-    image = get_by_id(image_id)
-    return image
+    image = await get_by_id(image_id)
+    return ORJSONResponse(image)
+
+@read_router.post("/images", response_model=ImageBatchResponse)
+async def get_images_data(
+    params: ImageBatchParams,
+    user_id: str = Depends(get_current_user)):
+    """
+    Statuses of many images in one query. Images of other users, unknown ids
+    and, with updated_since, images unchanged since then are left out.
+    """
+    if len(params.image_ids) > IMAGE_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=400, detail=f"Maximum {IMAGE_BATCH_MAX_SIZE} image ids allowed.")
+
+    images = await get_by_ids(set(params.image_ids), user_id, params.updated_since, params.include_result)
+    return ORJSONResponse({"images": images})
+
+@read_router.get("/events")
+async def image_events(user_id: str = Depends(get_stream_user)):
+    """
+    Server-Sent Events with the status changes of the user's images:
+    `status` events carry image_id, status and served_by, a `resync` event
+    means some were missed and the list should be reloaded.
+    """
+    # X-Accel-Buffering keeps nginx from holding events back
+    return StreamingResponse(
+        sse_stream(user_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@read_router.websocket("/ws")
+async def image_events_ws(websocket: WebSocket, token: str):
+    """The events of /api/events as JSON messages over a WebSocket."""
+    try:
+        user_id = await get_token_user(token)
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+    await websocket_stream(websocket, user_id)
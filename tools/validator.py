@@ -1,12 +1,19 @@
+import argparse
 import os
 import random
 import json
 import base64
 import requests
 import string
+import sys
+import time
 from io import BytesIO
 from PIL import Image
 
+# Receipt preprocessing steps shared with the app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+from src.process.vlm_preprocess import VLMPreprocessConfig, prepare_for_vlm
+
 # Directories for images and ground truth data
 IMG_DIR = "./SROIE2019/train/img"
 GT_DIR = "./SROIE2019/train/entities"
@@ -24,15 +31,19 @@ MAX_DIMENSION = 1024  # pixels
 JPEG_QUALITY = 30     # lower means more compression, smaller Base64
 
 
-def shrink_and_encode_image(image_path):
+def shrink_and_encode_image(image_path, config=None):
     """
-    1) Open image with PIL, 
+    1) Open image with PIL, applying the VLM preprocessing steps of config if given,
     2) Resize it to max dimension MAX_DIMENSION (preserve aspect ratio),
     3) Recompress as JPEG with quality=JPEG_QUALITY,
     4) Return the Base64-encoded string of the recompressed bytes.
     """
     # Open original image
-    img = Image.open(image_path)
+    with open(image_path, "rb") as f:
+        image_data = f.read()
+    if config is not None:
+        image_data = prepare_for_vlm(image_data, config)
+    img = Image.open(BytesIO(image_data))
     
     # Compute new size preserving aspect ratio
     w, h = img.size
@@ -47,7 +58,9 @@ def shrink_and_encode_image(image_path):
     
     # Recompress to JPEG in memory
     buffer = BytesIO()
-    img.convert("RGB").save(buffer, format="JPEG", quality=JPEG_QUALITY)
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+    img.save(buffer, format="JPEG", quality=JPEG_QUALITY)
     buffer.seek(0)
     
     # Encode bytes to Base64
@@ -59,7 +72,7 @@ import base64
 import json
 import requests
 
-def get_prediction(image_path):
+def get_prediction(image_path, img_b64=None):
     """
     Sends a shrunk Base64-encoded image to a Hugging Face Inference Endpoint
     and returns the extracted JSON receipt data. Assumes the model is trained
@@ -78,7 +91,8 @@ def get_prediction(image_path):
     }
 
     # Shrink and encode the image
-    img_b64 = shrink_and_encode_image(image_path)
+    if img_b64 is None:
+        img_b64 = shrink_and_encode_image(image_path)
 
     # Prompt instructing the model to extract fields and return strict JSON
     prompt = (
@@ -146,18 +160,29 @@ def load_ground_truth(txt_path):
             return {}
 
 
-def evaluate_predictions_symbolwise(samples):
+def evaluate_predictions_symbolwise(samples, config=None, stats=None):
     """
     Evaluates model predictions against ground truth on a character-by-character basis.
     Calculates symbol-wise precision, recall, and F1 score.
+    With a preprocessing config, images go through its steps first. If a stats
+    dict is given, it collects preprocessing and request seconds and payload bytes.
     """
     total_tp = 0  # True Positives (matching characters)
     total_fp = 0  # False Positives (extra characters in prediction)
     total_fn = 0  # False Negatives (missing characters in prediction)
+    if stats is None:
+        stats = {}
+    stats.update(preprocess_seconds=0.0, request_seconds=0.0, payload_bytes=0)
 
     for img_file, gt_file in samples:
         full_img_path = os.path.join(IMG_DIR, img_file)
-        pred = get_prediction(full_img_path)
+        started = time.perf_counter()
+        img_b64 = shrink_and_encode_image(full_img_path, config)
+        encoded = time.perf_counter()
+        pred = get_prediction(full_img_path, img_b64)
+        stats["preprocess_seconds"] += encoded - started
+        stats["request_seconds"] += time.perf_counter() - encoded
+        stats["payload_bytes"] += len(img_b64)
         print(f"Predicted first: {pred}")
         
         gt = load_ground_truth(os.path.join(GT_DIR, gt_file))
@@ -199,7 +224,39 @@ def evaluate_predictions_symbolwise(samples):
     return precision, recall, f1
 
 
+def evaluate_configs(samples, configs):
+    """
+    Runs the same samples through every preprocessing config and prints
+    F1 next to mean time and base64 payload size per image.
+    """
+    rows = []
+    for value in configs:
+        config = VLMPreprocessConfig.parse(value)
+        stats = {}
+        _, _, f1 = evaluate_predictions_symbolwise(samples, config, stats)
+        rows.append((config.key, f1, stats))
+
+    print(f"{'config':<36} {'F1':>7} {'prep ms':>9} {'request ms':>11} {'payload KB':>11}")
+    for key, f1, stats in rows:
+        n = len(samples)
+        print(
+            f"{key:<36} {f1:>7.4f} "
+            f"{stats['preprocess_seconds'] / n * 1000:>9.1f} "
+            f"{stats['request_seconds'] / n * 1000:>11.1f} "
+            f"{stats['payload_bytes'] / n / 1024:>11.1f}"
+        )
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Evaluate receipt extraction on SROIE")
+    parser.add_argument(
+        "--evaluate-preprocessing",
+        nargs="+",
+        metavar="STEPS",
+        help='compare VLM preprocessing configs, e.g. none crop "crop,grayscale,deskew,contrast"',
+    )
+    args = parser.parse_args()
+
     # List all image files and corresponding ground truth .txt files
     try:
         all_images = [f for f in os.listdir(IMG_DIR) if f.lower().endswith(".jpg")]
@@ -222,6 +279,10 @@ def main():
     # Randomly select 100 samples
     selected = random.sample(samples, NUM_SAMPLES)
 
+    if args.evaluate_preprocessing:
+        evaluate_configs(selected, args.evaluate_preprocessing)
+        return
+
     # Evaluate
     precision, recall, f1_score = evaluate_predictions_symbolwise(selected)
 